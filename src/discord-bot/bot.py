@@ -12,6 +12,7 @@ import os
 import platform
 import random
 import sys
+import time
 
 import aiosqlite
 import discord
@@ -19,6 +20,12 @@ from discord.ext import commands, tasks
 from discord.ext.commands import Context
 from dotenv import load_dotenv, dotenv_values
 
+# The bot imports the loader's embedding cache and pool stats modules
+# (notion-extractor/utils) rather than copies, so the two sides can't drift
+sys.path.insert(1, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "notion-extractor"))
+
+from cogs.llm_flow.rag import RagEngine
+
 if not os.path.isfile(f"{os.path.realpath(os.path.dirname(__file__))}/config.json"):
     sys.exit("'config.json' not found! Please add it and try again.")
 else:
@@ -41,6 +48,23 @@ config["POSTGRES_PASSWORD"] = os.getenv("POSTGRES_PASSWORD")
 config["POSTGRES_DBNAME"] = os.getenv("POSTGRES_DBNAME")
 config["POSTGRES_HOST"] = os.getenv("POSTGRES_HOST")
 config["POSTGRES_PORT"] = os.getenv("POSTGRES_PORT")
+config["MAX_CONCURRENT_ANSWERS"] = int(os.getenv("MAX_CONCURRENT_ANSWERS", 2))
+config["EMBEDDING_WORKERS"] = int(os.getenv("EMBEDDING_WORKERS", 1))
+config["DB_POOL_MIN_SIZE"] = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+config["DB_POOL_MAX_SIZE"] = int(os.getenv("DB_POOL_MAX_SIZE", 4))
+config["STREAM_EDIT_INTERVAL"] = float(os.getenv("STREAM_EDIT_INTERVAL", 1.0))
+config["SEMANTIC_CACHE_THRESHOLD"] = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.95))
+config["SEMANTIC_CACHE_TTL"] = float(os.getenv("SEMANTIC_CACHE_TTL", 24 * 60 * 60))
+config["SEMANTIC_CACHE_MAX_ENTRIES"] = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", 500))
+config["SEMANTIC_CACHE_MAX_BYTES"] = int(os.getenv("SEMANTIC_CACHE_MAX_BYTES", 16 * 1024 * 1024))
+config["NARRATIVE_REFRESH_INTERVAL"] = float(os.getenv("NARRATIVE_REFRESH_INTERVAL", 300))
+config["VECTOR_EF_SEARCH"] = int(os.getenv("VECTOR_EF_SEARCH", 100))
+config["VECTOR_PROBES"] = int(os.getenv("VECTOR_PROBES", 10))
+config["CONTEXT_TOKEN_BUDGET"] = int(os.getenv("CONTEXT_TOKEN_BUDGET", 6000))
+config["RETRIEVAL_CANDIDATES"] = int(os.getenv("RETRIEVAL_CANDIDATES", 20))
+config["COLLECTION_ALIAS_TTL"] = float(os.getenv("COLLECTION_ALIAS_TTL", 30))
+config["EMBEDDING_CACHE_PATH"] = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite")
+config["EMBEDDING_CACHE_MAX_BYTES"] = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 512 * 1024 * 1024))
 
 """	
 Setup bot intents (events restrictions)
@@ -158,6 +182,7 @@ class DiscordBot(commands.Bot):
         """
         self.logger = logger
         self.config = config
+        self.rag_engine = None
 
     async def load_cogs(self) -> None:
         """
@@ -186,7 +211,47 @@ class DiscordBot(commands.Bot):
             f"Running on: {platform.system()} {platform.release()} ({os.name})"
         )
         self.logger.info("-------------------")
+        await self.init_rag_engine()
         await self.load_cogs()
+        self.refresh_narrative_task.change_interval(
+            seconds=self.config["NARRATIVE_REFRESH_INTERVAL"]
+        )
+        self.refresh_narrative_task.start()
+
+    async def init_rag_engine(self) -> None:
+        """
+        Build the RAG engine once and warm it up so the first /lore call doesn't pay for model loading.
+        """
+        start = time.perf_counter()
+        self.rag_engine = RagEngine(self.config, k=self.config["RETRIEVAL_CANDIDATES"])
+        await self.rag_engine.warmup()
+        self.logger.info(
+            f"RAG engine warmed up in {time.perf_counter() - start:.2f}s"
+        )
+
+    @tasks.loop(minutes=5.0)
+    async def refresh_narrative_task(self) -> None:
+        """
+        Regenerate the stored /last-session narrative in the background once the loader has synced new session notes.
+        """
+        try:
+            await self.rag_engine.refresh_last_session_narrative()
+        except Exception as e:
+            self.logger.error(
+                f"Failed to refresh last session narrative\n{type(e).__name__}: {e}"
+            )
+
+    @refresh_narrative_task.before_loop
+    async def before_refresh_narrative_task(self) -> None:
+        """
+        Before starting the narrative refresh task, we make sure the bot is ready
+        """
+        await self.wait_until_ready()
+
+    async def close(self) -> None:
+        if self.rag_engine is not None:
+            await self.rag_engine.close()
+        await super().close()
 
     async def on_message(self, message: discord.Message) -> None:
         """
@@ -10,8 +10,8 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 from discord.ext.commands import Context
-from .llm_flow import rag
-import re
+
+from .llm_flow.streaming import DiscordStreamHandler
 
 class General(commands.Cog, name="general"):
     def __init__(self, bot) -> None:
@@ -115,16 +115,12 @@ class General(commands.Cog, name="general"):
             return
         print("/lore command triggered")
         question = context.message.content.split("lore", 1)[1]
-        response = await rag.prompt_rag_flow(query=question, config=self.bot.config)
-        reply_content = f"```{response}```"
-        message_max_length = 2000
-        if len(response) > (message_max_length - 6): #subtract 6 characters for backticks to put content in quote block
-            trimmed_response = response[:message_max_length-6]
-            last_full_stop_idx = trimmed_response.rfind(".")
-            trimmed_response = trimmed_response[:last_full_stop_idx + 1]
-            reply_content = f"```{trimmed_response}```"
-        
-        await context.message.reply(reply_content)
+        handler = self.stream_handler(context)
+        response = None
+        try:
+            response = await self.bot.rag_engine.prompt_rag_flow(query=question, callbacks=[handler])
+        finally:
+            await handler.finish(response)
 
     @commands.hybrid_command(
         name="last-session",
@@ -134,36 +130,18 @@ class General(commands.Cog, name="general"):
         if context.message.channel.name != self.bot.config["channel"]:
             return
         print("/last-session command triggered")
-        response = await rag.prompt_rag_flow_last_session(config=self.bot.config)
-        response_chunks = await self.chunk_message_content(response)
-        for chunk in response_chunks:
-            await context.message.reply(chunk)
-
-    async def chunk_message_content(self, text):
-        MAX_LENGTH = 2000
-        CHUNK_SIZE = MAX_LENGTH - 6 # Reserve 6 characters for backticks for quote block
-        LINE_BREAKS_PER_CHUNK = 20
-
-        lines = text.split("\n")
-
-        chunks = []
-        current_chunk = ""
-        current_length = 0
-        current_line_count = 0
-
-        for line in lines:
-            if current_length + len(line) + current_line_count * LINE_BREAKS_PER_CHUNK > CHUNK_SIZE:
-                chunks.append(f"```{current_chunk.strip()}```")
-                current_chunk = ""
-                current_length = 0
-            current_chunk += line + "\n"
-            current_length += len(line) + 1
-            current_line_count += 1
-        
-        if current_chunk:
-            chunks.append(f"```{current_chunk.strip()}```")
-
-        return chunks
+        handler = self.stream_handler(context)
+        response = None
+        try:
+            response = await self.bot.rag_engine.prompt_rag_flow_last_session(callbacks=[handler])
+        finally:
+            await handler.finish(response)
+
+    def stream_handler(self, context: Context) -> DiscordStreamHandler:
+        return DiscordStreamHandler(
+            context.message,
+            edit_interval=self.bot.config["STREAM_EDIT_INTERVAL"],
+        )
 
 async def setup(bot) -> None:
     await bot.add_cog(General(bot))
@@ -0,0 +1,133 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class CacheEntry:
+    def __init__(self, question: str, embedding: np.ndarray, answer: str) -> None:
+        self.question = question
+        self.embedding = embedding
+        self.answer = answer
+        self.created_at = time.monotonic()
+        self.size = embedding.nbytes + len(question.encode()) + len(answer.encode())
+
+
+class SemanticAnswerCache:
+    """In-memory cache mapping question embeddings to previously generated answers.
+
+    A lookup is a hit when the cosine similarity between the new question and a
+    cached one is at least ``threshold``. Entries expire after ``ttl`` seconds
+    and the least recently used ones are evicted once either ``max_entries`` or
+    ``max_bytes`` is exceeded. Every lookup passes the current collection
+    version; when the loader has bumped it the whole cache is dropped, since
+    any answer may now be out of date.
+
+    Args:
+        threshold (float): Minimum cosine similarity for a hit.
+        ttl (float): Seconds an answer stays valid.
+        max_entries (int): Maximum number of cached answers.
+        max_bytes (int): Approximate memory cap for embeddings plus text.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        ttl: float = 24 * 60 * 60,
+        max_entries: int = 500,
+        max_bytes: int = 16 * 1024 * 1024,
+    ) -> None:
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self.size = 0
+        self.version: Optional[int] = None
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, embedding: Sequence[float], version: int) -> Optional[str]:
+        """Return a cached answer for a question similar to ``embedding``, if any."""
+        self._check_version(version)
+        self._expire()
+
+        query = _normalise(embedding)
+        best_key, best_score = None, -1.0
+        if self.entries:
+            keys: List[str] = list(self.entries.keys())
+            matrix = np.stack([self.entries[key].embedding for key in keys])
+            scores = matrix @ query
+            best = int(np.argmax(scores))
+            best_key, best_score = keys[best], float(scores[best])
+
+        if best_key is not None and best_score >= self.threshold:
+            self.entries.move_to_end(best_key)
+            self.hits += 1
+            print(f"cache.py -- semantic cache hit (similarity {best_score:.3f}, question '{best_key.strip()}')")
+            return self.entries[best_key].answer
+
+        self.misses += 1
+        return None
+
+    def put(self, question: str, embedding: Sequence[float], answer: str, version: int) -> None:
+        self._check_version(version)
+        if question in self.entries:
+            self._remove(question)
+        entry = CacheEntry(question, _normalise(embedding), answer)
+        self.entries[question] = entry
+        self.size += entry.size
+
+        while self.entries and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "version": self.version,
+        }
+
+    def _check_version(self, version: int) -> None:
+        if self.version is not None and version != self.version:
+            if self.entries:
+                self.invalidations += 1
+                print(f"cache.py -- collection version changed {self.version} -> {version}, dropping {len(self.entries)} cached answers")
+            self.clear()
+        self.version = version
+
+    def _expire(self) -> None:
+        cutoff = time.monotonic() - self.ttl
+        # Entries are only ever appended or moved to the end on a hit, so expired
+        # ones are not necessarily at the front; scan them all.
+        for key in [key for key, entry in self.entries.items() if entry.created_at < cutoff]:
+            self._remove(key)
+            self.expirations += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self.entries.pop(key)
+        self.size -= entry.size
+
+
+def _normalise(embedding: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,72 @@
+from typing import Callable, List, Optional, Set
+
+import tiktoken
+from langchain_core.documents import Document
+
+from .streaming import CODE_BLOCK_OVERHEAD, DISCORD_MAX_MESSAGE_LENGTH
+
+# Rough characters per token for English prose with the GPT-4o tokenizer; used
+# to turn Discord's character limit into an output token limit.
+CHARS_PER_TOKEN = 4
+
+
+def discord_answer_max_tokens(max_length: int = DISCORD_MAX_MESSAGE_LENGTH) -> int:
+    """Output token limit for an answer that should fit in one Discord message."""
+    return (max_length - CODE_BLOCK_OVERHEAD) // CHARS_PER_TOKEN
+
+
+def tiktoken_counter(model_name: str) -> Callable[[str], int]:
+    try:
+        encoding = tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        encoding = tiktoken.get_encoding("o200k_base")
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+class ContextPacker:
+    """Fills a token budget with the best retrieved context for a question.
+
+    Candidates are whole documents and chunks ordered by similarity. Each is
+    taken greedily, best first, if it still fits in the budget, using the token
+    counts the loader stores in ``cmetadata["token_count"]`` (counting on the
+    fly only for rows ingested before that existed). Content is deduplicated by
+    page id: once a page's whole document is in, none of its chunks are added,
+    and once any of its chunks are in, its whole document is skipped.
+
+    Args:
+        budget_tokens (int): Maximum number of context tokens to pack.
+        count_tokens (Callable[[str], int]): Fallback token counter.
+    """
+
+    def __init__(self, budget_tokens: int, count_tokens: Callable[[str], int]) -> None:
+        self.budget_tokens = budget_tokens
+        self.count_tokens = count_tokens
+
+    def pack(self, candidates: List[Document]) -> List[Document]:
+        packed: List[Document] = []
+        used_tokens = 0
+        whole_pages: Set[Optional[str]] = set()
+        chunked_pages: Set[Optional[str]] = set()
+        seen_content: Set[str] = set()
+
+        for doc in candidates:
+            page_id = doc.metadata.get("id")
+            is_document = doc.metadata.get("embedding_type") == "document"
+            if page_id in whole_pages or (is_document and page_id in chunked_pages):
+                continue
+            if doc.page_content in seen_content:
+                continue
+
+            tokens = doc.metadata.get("token_count")
+            if tokens is None:
+                tokens = self.count_tokens(doc.page_content)
+            if used_tokens + tokens > self.budget_tokens:
+                continue
+
+            packed.append(doc)
+            used_tokens += tokens
+            seen_content.add(doc.page_content)
+            (whole_pages if is_document else chunked_pages).add(page_id)
+
+        print(f"context.py -- packed {len(packed)}/{len(candidates)} candidates into {used_tokens}/{self.budget_tokens} tokens")
+        return packed
@@ -0,0 +1,99 @@
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from psycopg import AsyncConnection
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import namedtuple_row
+from psycopg_pool import AsyncConnectionPool
+# Shared with the loader; bot.py puts notion-extractor on sys.path
+from utils.db import PoolStats
+
+
+class Database:
+    """Shared async Postgres connection pool for the bot's direct SQL paths.
+
+    Queries are always parameterized and executed with ``prepare=True`` so the
+    hot statements are prepared server-side once per pooled connection.
+
+    Args:
+        config (dict): Bot config containing the POSTGRES_* and DB_POOL_* keys.
+    """
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        conninfo = make_conninfo(
+            host=config["POSTGRES_HOST"],
+            port=config["POSTGRES_PORT"],
+            dbname=config["POSTGRES_DBNAME"],
+            user=config["POSTGRES_USER"],
+            password=config["POSTGRES_PASSWORD"],
+        )
+        self.pool = AsyncConnectionPool(
+            conninfo,
+            min_size=int(config.get("DB_POOL_MIN_SIZE") or 1),
+            max_size=int(config.get("DB_POOL_MAX_SIZE") or 4),
+            kwargs={"autocommit": True},
+            open=False,
+        )
+        self.pool_stats = PoolStats()
+
+    async def open(self) -> None:
+        await self.pool.open(wait=True)
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[AsyncConnection]:
+        start = time.perf_counter()
+        async with self.pool.connection() as conn:
+            self.pool_stats.record_acquire(time.perf_counter() - start)
+            yield conn
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[AsyncConnection]:
+        """Check out a connection and run everything inside one transaction."""
+        async with self.connection() as conn:
+            async with conn.transaction():
+                yield conn
+
+    async def execute(self, query: str, params: Optional[Dict[str, Any]] = None, conn: Optional[AsyncConnection] = None) -> int:
+        """Run a statement and return the number of affected rows."""
+        async with self._use(conn) as c:
+            start = time.perf_counter()
+            async with c.cursor() as cur:
+                await cur.execute(query, params, prepare=True)
+                rowcount = cur.rowcount
+            self.pool_stats.record_query(time.perf_counter() - start)
+        return rowcount
+
+    async def fetchall(self, query: str, params: Optional[Dict[str, Any]] = None, conn: Optional[AsyncConnection] = None, row_factory=namedtuple_row) -> List[Any]:
+        async with self._use(conn) as c:
+            start = time.perf_counter()
+            async with c.cursor(row_factory=row_factory) as cur:
+                await cur.execute(query, params, prepare=True)
+                rows = await cur.fetchall()
+            self.pool_stats.record_query(time.perf_counter() - start)
+        return rows
+
+    async def fetchone(self, query: str, params: Optional[Dict[str, Any]] = None, conn: Optional[AsyncConnection] = None, row_factory=namedtuple_row) -> Any:
+        async with self._use(conn) as c:
+            start = time.perf_counter()
+            async with c.cursor(row_factory=row_factory) as cur:
+                await cur.execute(query, params, prepare=True)
+                row = await cur.fetchone()
+            self.pool_stats.record_query(time.perf_counter() - start)
+        return row
+
+    @asynccontextmanager
+    async def _use(self, conn: Optional[AsyncConnection]) -> AsyncIterator[AsyncConnection]:
+        """Reuse a caller's connection (e.g. inside a transaction) or borrow one from the pool."""
+        if conn is not None:
+            yield conn
+        else:
+            async with self.connection() as c:
+                yield c
+
+    def stats(self) -> Dict[str, Any]:
+        """Return our acquire/query timings merged with psycopg_pool's own counters."""
+        return {**self.pool.get_stats(), **self.pool_stats.as_dict()}
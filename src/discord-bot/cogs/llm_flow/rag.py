@@ -1,20 +1,24 @@
-from typing import Any, Dict
-import psycopg
-from psycopg.rows import namedtuple_row
+import asyncio
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Dict, List
 
-from langchain.chains.llm import LLMChain
+import psycopg
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from langchain.chains.question_answering import load_qa_chain
 
-#from langchain_community.vectorstores.pgvector import PGVector
-from langchain_postgres import PGVector
-from langchain_postgres.vectorstores import PGVector
 from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain.prompts import PromptTemplate
-from langchain.chains import ConversationalRetrievalChain
-from langchain.chains.conversational_retrieval.prompts import CONDENSE_QUESTION_PROMPT
 
 from langchain_community.chat_models import ChatOpenAI
+# Shared with the loader; bot.py puts notion-extractor on sys.path
+from utils.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+from .cache import SemanticAnswerCache
+from .context import ContextPacker, discord_answer_max_tokens, tiktoken_counter
+from .db import Database
 
 lore_prompt_template = """SYSTEM: You are a loremaster with knowledge of the setting and world of a Dungeons and Dragons campaign, and answser user questions about the history of the setting and previous events that have transpired in the course of the campaign.
 ---
@@ -51,141 +55,357 @@ LORE_QA_PROMPT = PromptTemplate(
     template=lore_prompt_template, input_variables=["context", "question"]
 )
 
-async def prompt_rag_flow(
-    query,
-    config,
-    model_name="gpt-4o",
-    temperature=0.5,
-    k=5,
-    search_type="similarity",
-    history="",
-    verbose=False,
-) -> Dict[str, Any]:
-
-    # Establish vector DB and retriever
-    print("rag.py -- Establishing vector DB")
-    embeddings = HuggingFaceEmbeddings()
-    collection_name = config["COLLECTION_NAME"]
-    vectors = PGVector.from_existing_index(
-        embedding=embeddings,
-        collection_name=collection_name,
-        connection=f"postgresql+psycopg://{config['POSTGRES_USER']}:{config['POSTGRES_PASSWORD']}@{config['POSTGRES_HOST']}:{config['POSTGRES_PORT']}/{config['POSTGRES_DBNAME']}",
-    )
-
-    retriever = vectors.as_retriever(search_type=search_type, search_kwargs={"k": k, "filter": {"embedding_type":"document"}})
-
-    # Construct a ConversationalRetrievalChain with a streaming llm for combine docs
-    # and a separate, non-streaming llm for question generation
-    print("rag.py -- Establishing OpenAI connection")
-    llm = ChatOpenAI(temperature=temperature, model_name=model_name, api_key=config["OPENAI_API_KEY"])
-    streaming_llm = ChatOpenAI(
-        streaming=True,
-        model_name=model_name,
-        callbacks=[StreamingStdOutCallbackHandler()],
-        temperature=temperature,
-        api_key=config["OPENAI_API_KEY"],
-    )
-
-    question_generator = LLMChain(
-        llm=llm, prompt=CONDENSE_QUESTION_PROMPT, verbose=verbose
-    )
-    doc_chain = load_qa_chain(
-        streaming_llm,
-        chain_type="stuff",
-        prompt=LORE_QA_PROMPT,
-        verbose=verbose,
-    )
-
-    qa = ConversationalRetrievalChain(
-        retriever=retriever,
-        combine_docs_chain=doc_chain,
-        question_generator=question_generator,
-        verbose=verbose,
-        return_source_documents=True,
-    )
-
-    result = qa({"question": query, "chat_history": history})
-
-    return result["answer"]
-
-async def prompt_rag_flow_last_session(
-    config,
-    n_previous_sessions_context=5,
-    model_name="gpt-4o",
-    temperature=0.5,
-    verbose=False,
-) -> Dict[str, Any]:
-
-    collection_name = config["COLLECTION_NAME"]
-    
-    # Connect directly to vector DB to retrieve documents based on metadata rather than vector search
-    conn = psycopg.connect(
-        host=config["POSTGRES_HOST"],
-        user=config["POSTGRES_USER"],
-        password=config["POSTGRES_PASSWORD"],
-        port=config["POSTGRES_PORT"],
-        dbname=config["POSTGRES_DBNAME"]
-    )
-    cur = conn.cursor(row_factory=namedtuple_row)
-
-    # Retrieve the most recent session summary
-    cur.execute(
-        # f"""
-        # SELECT embeddings.*
-        # FROM langchain_pg_embedding embeddings
-        # JOIN langchain_pg_collection collection
-        #     ON embeddings.collection_id = collection.uuid
-        # WHERE collection.name = '{collection_name}'
-        # AND embeddings.cmetadata->>'name' LIKE 'Session Notes%'
-        # AND (embeddings.cmetadata->>'is_latest')::boolean = true;
-        # """
-        f"""
-        SELECT embeddings.*
-        FROM langchain_pg_embedding embeddings
-        JOIN langchain_pg_collection collection
-            ON embeddings.collection_id = collection.uuid
-        WHERE collection.name = '{collection_name}'
-        AND embeddings.cmetadata->>'name' LIKE 'Session Notes%'
-        AND embeddings.cmetadata->>'embedding_type' = 'document'
-        ORDER BY (embeddings.cmetadata->>'session_number')::INT DESC
-        LIMIT 1;
-        """
-    )
-
-    last_session_summary = cur.fetchone().document
-
-    # Retrieve the next most recent n sessions summaries
-    cur.execute(
-        f"""
-        SELECT embeddings.*
-        FROM langchain_pg_embedding embeddings
-        JOIN langchain_pg_collection collection
-            ON embeddings.collection_id = collection.uuid
-        WHERE collection.name = '{collection_name}'
-        AND embeddings.cmetadata->>'embedding_type' = 'document'
-        AND embeddings.cmetadata->>'name' LIKE 'Session Notes%'
-        AND (embeddings.cmetadata->>'is_latest') IS NULL 
-        ORDER BY (embeddings.cmetadata->>'session_number')::INT DESC
-        LIMIT {n_previous_sessions_context};
-        """
-    )
-
-    # Join previous session summaries into a contiguous string in prepartion for prompt injection
-    previous_session_summaries = "\n".join([
-        f"-- SESSION {row.cmetadata['session_number']} -- \n{row.document}"
-        for row in cur.fetchall() 
-    ])
-
-    cur.close()
-    conn.close()
-
-    prompt = LAST_SESSION_PROMPT_TEMPLATE.format(
-        previous_summaries_context=previous_session_summaries,
-        last_session_context=last_session_summary,
-    )
-
-    llm = ChatOpenAI(temperature=temperature, model_name=model_name, api_key=config["OPENAI_API_KEY"])
-    result = llm.invoke(prompt)
-
-    return result.content
-
+# Retrieve the most recent session summary followed by the next most recent
+# sessions, newest first, as an index range read over the loader-maintained timeline
+SESSION_TIMELINE_QUERY = """
+    SELECT timeline.session_number, embeddings.document
+    FROM loremaster_session_timeline timeline
+    JOIN langchain_pg_embedding embeddings
+        ON embeddings.id = timeline.document_id
+    WHERE timeline.collection_name = %(collection_name)s
+    ORDER BY timeline.session_number DESC, timeline.created_time DESC
+    LIMIT %(limit)s;
+"""
+
+# Nearest documents and chunks to the question, as candidates for the context
+# packer. The ORDER BY matches the HNSW/IVFFlat index the loader builds on the
+# embedding column (cosine distance).
+LORE_RETRIEVAL_QUERY = """
+    SELECT embeddings.id, embeddings.document, embeddings.cmetadata
+    FROM langchain_pg_embedding embeddings
+    JOIN langchain_pg_collection collection
+        ON embeddings.collection_id = collection.uuid
+    WHERE collection.name = %(collection_name)s
+    ORDER BY embeddings.embedding <=> %(embedding)s::vector
+    LIMIT %(k)s;
+"""
+
+# The stored storyteller narrative for /last-session. The loader sets
+# invalidated_at whenever session notes change; the narrative is stale if it
+# was generated before that. now() is read from the DB so that the generation
+# timestamp we store later is on the same clock as the loader's invalidations.
+STORED_NARRATIVE_QUERY = """
+    SELECT narrative.narrative,
+        (narrative.generated_at IS NULL OR narrative.generated_at < narrative.invalidated_at) AS stale,
+        db_time.checked_at
+    FROM (SELECT now() AS checked_at) db_time
+    LEFT JOIN loremaster_session_narrative narrative
+        ON narrative.collection_name = %(collection_name)s;
+"""
+
+STORE_NARRATIVE_QUERY = """
+    INSERT INTO loremaster_session_narrative (collection_name, narrative, generated_at, invalidated_at)
+    VALUES (%(collection_name)s, %(narrative)s, %(generated_at)s, %(generated_at)s)
+    ON CONFLICT (collection_name) DO UPDATE
+        SET narrative = EXCLUDED.narrative,
+            generated_at = EXCLUDED.generated_at;
+"""
+
+# The loader builds full reindexes into a shadow collection and then points
+# the COLLECTION_NAME alias at it. Before the first swap there is no alias row
+# and COLLECTION_NAME is itself the live collection.
+COLLECTION_ALIAS_QUERY = """
+    SELECT collection_name
+    FROM loremaster_collection_alias
+    WHERE alias = %(alias)s;
+"""
+
+# Bumped by the loader every time it changes the collection (including alias swaps)
+COLLECTION_VERSION_QUERY = """
+    SELECT version
+    FROM loremaster_collection_version
+    WHERE collection_name = %(collection_name)s;
+"""
+
+class ExecutorEmbeddings(Embeddings):
+    """Embeddings wrapper that runs the async API on a dedicated, bounded executor.
+
+    The default ``aembed_*`` implementations use the event loop's shared executor,
+    which lets an unbounded number of CPU-bound encodes pile up behind each other.
+    """
+
+    def __init__(self, embeddings: Embeddings, executor: Executor) -> None:
+        self.embeddings = embeddings
+        self.executor = executor
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.embed_documents, texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.embed_query, text)
+
+
+class RagEngine:
+    """Long-lived RAG engine shared by the bot's cogs.
+
+    Builds the embeddings model, DB pool, LLM client and QA chain once so
+    that each /lore or /last-session call only pays for the query itself.
+
+    All I/O goes through the async LangChain/psycopg APIs so answering a question
+    never blocks the Discord event loop. Embedding runs on a small dedicated
+    thread pool (``EMBEDDING_WORKERS``) and at most ``MAX_CONCURRENT_ANSWERS``
+    answers are generated at once; further requests queue on a semaphore.
+
+    Lore context is packed into a token budget (``CONTEXT_TOKEN_BUDGET``) from
+    the ``k`` nearest documents and chunks, and lore answers are capped at
+    roughly one Discord message worth of output tokens.
+
+    Lore answers are kept in a semantic cache keyed by the question embedding,
+    which is dropped whenever the loader bumps the collection version. The
+    /last-session narrative is generated ahead of time and served from the DB;
+    it is only generated live when the stored copy is missing or stale.
+
+    ``COLLECTION_NAME`` is an alias: retrieval and the session timeline read
+    from the collection it currently points to, cached for
+    ``COLLECTION_ALIAS_TTL`` seconds and re-resolved as soon as the collection
+    version changes. The version and narrative are tracked per alias.
+    """
+
+    def __init__(
+        self,
+        config,
+        model_name="gpt-4o",
+        temperature=0.5,
+        k=20,
+        verbose=False,
+    ) -> None:
+        self.config = config
+        self.model_name = model_name
+        self.temperature = temperature
+        self.k = k
+        self.verbose = verbose
+
+        self.embedding_executor = ThreadPoolExecutor(
+            max_workers=int(config.get("EMBEDDING_WORKERS") or 1),
+            thread_name_prefix="rag-embed",
+        )
+        self.answer_slots = asyncio.Semaphore(int(config.get("MAX_CONCURRENT_ANSWERS") or 2))
+        self.db = Database(config)
+        self.answer_cache = SemanticAnswerCache(
+            threshold=float(config.get("SEMANTIC_CACHE_THRESHOLD") or 0.95),
+            ttl=float(config.get("SEMANTIC_CACHE_TTL") or 24 * 60 * 60),
+            max_entries=int(config.get("SEMANTIC_CACHE_MAX_ENTRIES") or 500),
+            max_bytes=int(config.get("SEMANTIC_CACHE_MAX_BYTES") or 16 * 1024 * 1024),
+        )
+
+        self.context_packer = ContextPacker(
+            budget_tokens=int(config.get("CONTEXT_TOKEN_BUDGET") or 6000),
+            count_tokens=tiktoken_counter(model_name),
+        )
+        self.alias_ttl = float(config.get("COLLECTION_ALIAS_TTL") or 30)
+        self.live_collection_name = None
+        self.live_collection_expires_at = 0.0
+        self.live_collection_version = None
+        self.ef_search = config.get("VECTOR_EF_SEARCH")
+        self.probes = config.get("VECTOR_PROBES")
+
+        self.embeddings = None
+        self.streaming_llm = None
+        self.doc_chain = None
+
+    async def warmup(self) -> None:
+        """Load the embeddings model, connect the vector store and build the chain."""
+        config = self.config
+        loop = asyncio.get_running_loop()
+
+        # Establish vector DB and embeddings model. Loading the model is slow and
+        # CPU bound, so do it on the embedding executor rather than the event loop.
+        print("rag.py -- Establishing vector DB")
+        await self.db.open()
+        embeddings = await loop.run_in_executor(self.embedding_executor, HuggingFaceEmbeddings)
+        if self.config.get("EMBEDDING_CACHE_PATH"):
+            embeddings = CachedEmbeddings(
+                embeddings,
+                embeddings.model_name,
+                EmbeddingCache(self.config["EMBEDDING_CACHE_PATH"], max_bytes=int(self.config.get("EMBEDDING_CACHE_MAX_BYTES") or 512 * 1024 * 1024)),
+            )
+        self.embeddings = ExecutorEmbeddings(embeddings, self.embedding_executor)
+
+        # Construct a "stuff" QA chain with a streaming llm. Retrieval is done by
+        # hand so the question embedding can be shared with the answer cache.
+        print("rag.py -- Establishing OpenAI connection")
+        self.streaming_llm = ChatOpenAI(
+            streaming=True,
+            model_name=self.model_name,
+            callbacks=[StreamingStdOutCallbackHandler()],
+            temperature=self.temperature,
+            api_key=config["OPENAI_API_KEY"],
+        )
+
+        # Only /lore answers are capped at one Discord message; the /last-session
+        # narrative uses the uncapped LLM and rolls over into further messages
+        self.doc_chain = load_qa_chain(
+            self.streaming_llm.bind(max_tokens=discord_answer_max_tokens()),
+            chain_type="stuff",
+            prompt=LORE_QA_PROMPT,
+            verbose=self.verbose,
+        )
+
+        # Run one embedding and one similarity search so the model weights and
+        # the DB connection pool are hot before the first real question (on a
+        # fresh database the search finds no tables and returns nothing)
+        await self.similarity_search(await self.embeddings.aembed_query("warmup"), k=1)
+
+    async def close(self) -> None:
+        print(f"rag.py -- DB pool stats: {self.db.stats()}")
+        await self.db.close()
+        self.embedding_executor.shutdown(wait=False)
+        if self.embeddings is not None and isinstance(self.embeddings.embeddings, CachedEmbeddings):
+            self.embeddings.embeddings.cache.close()
+
+    async def collection_version(self) -> int:
+        try:
+            row = await self.db.fetchone(
+                COLLECTION_VERSION_QUERY, {"collection_name": self.config["COLLECTION_NAME"]}
+            )
+        except psycopg.errors.UndefinedTable:
+            # The loader hasn't created the version table yet
+            return 0
+        version = row.version if row else 0
+        if version != self.live_collection_version:
+            # A swap bumps the version, so don't wait out the alias TTL
+            self.live_collection_expires_at = 0.0
+            self.live_collection_version = version
+        return version
+
+    async def live_collection(self) -> str:
+        """Resolve the COLLECTION_NAME alias to the collection currently serving reads."""
+        now = time.monotonic()
+        if self.live_collection_name is None or now >= self.live_collection_expires_at:
+            alias = self.config["COLLECTION_NAME"]
+            try:
+                row = await self.db.fetchone(COLLECTION_ALIAS_QUERY, {"alias": alias})
+            except psycopg.errors.UndefinedTable:
+                # The loader hasn't created the alias table yet
+                row = None
+            self.live_collection_name = row.collection_name if row else alias
+            self.live_collection_expires_at = now + self.alias_ttl
+        return self.live_collection_name
+
+    async def similarity_search(self, embedding, k) -> List[Document]:
+        """Fetch the k nearest documents and chunks, applying the configured ANN search settings to this query only."""
+        collection_name = await self.live_collection()
+        try:
+            async with self.db.transaction() as conn:
+                if self.ef_search:
+                    await conn.execute("SELECT set_config('hnsw.ef_search', %s, true)", (str(self.ef_search),))
+                if self.probes:
+                    await conn.execute("SELECT set_config('ivfflat.probes', %s, true)", (str(self.probes),))
+                rows = await self.db.fetchall(
+                    LORE_RETRIEVAL_QUERY,
+                    {
+                        "collection_name": collection_name,
+                        "embedding": "[" + ",".join(str(x) for x in embedding) + "]",
+                        "k": k,
+                    },
+                    conn=conn,
+                )
+        except psycopg.errors.UndefinedTable:
+            # The loader hasn't created the collection tables yet, so answer without context
+            print("rag.py -- Vector store tables not found, retrieving no context")
+            return []
+        return [Document(id=row.id, page_content=row.document, metadata=row.cmetadata) for row in rows]
+
+    async def prompt_rag_flow(self, query, callbacks=None) -> str:
+        query_embedding = await self.embeddings.aembed_query(query)
+        version = await self.collection_version()
+
+        # Cache hits skip the answer slots entirely
+        answer = self.answer_cache.get(query_embedding, version)
+        if answer is None:
+            async with self.answer_slots:
+                # Re-read after queueing, so the answer is tagged with the data it is built from
+                version = await self.collection_version()
+                candidates = await self.similarity_search(query_embedding, k=self.k)
+                docs = self.context_packer.pack(candidates)
+                result = await self.doc_chain.ainvoke(
+                    {"input_documents": docs, "question": query},
+                    config={"callbacks": callbacks},
+                )
+            answer = result["output_text"]
+            # A sync or alias swap that finished mid-answer may have changed what
+            # the search returned, so only cache answers from an unchanged collection
+            if await self.collection_version() == version:
+                self.answer_cache.put(query.strip(), query_embedding, answer, version)
+
+        print(f"rag.py -- semantic cache stats: {self.answer_cache.stats()}")
+        print(f"rag.py -- DB pool stats: {self.db.stats()}")
+        if isinstance(self.embeddings.embeddings, CachedEmbeddings):
+            print(f"rag.py -- embedding cache stats: {self.embeddings.embeddings.cache.stats()}")
+        return answer
+
+    async def prompt_rag_flow_last_session(self, n_previous_sessions_context=5, callbacks=None) -> str:
+        stored = await self.stored_last_session_narrative()
+        if stored is not None and stored.narrative is not None and not stored.stale:
+            return stored.narrative
+
+        narrative = await self.generate_last_session_narrative(n_previous_sessions_context, callbacks)
+        await self.store_last_session_narrative(narrative, stored)
+        return narrative
+
+    async def refresh_last_session_narrative(self, n_previous_sessions_context=5) -> bool:
+        """Regenerate the stored /last-session narrative if the loader has invalidated it."""
+        stored = await self.stored_last_session_narrative()
+        if stored is None or (stored.narrative is not None and not stored.stale):
+            return False
+
+        print("rag.py -- Regenerating stale last session narrative")
+        narrative = await self.generate_last_session_narrative(n_previous_sessions_context)
+        await self.store_last_session_narrative(narrative, stored)
+        return True
+
+    async def stored_last_session_narrative(self):
+        try:
+            return await self.db.fetchone(
+                STORED_NARRATIVE_QUERY, {"collection_name": self.config["COLLECTION_NAME"]}
+            )
+        except psycopg.errors.UndefinedTable:
+            # The loader hasn't created the narrative table yet
+            return None
+
+    async def store_last_session_narrative(self, narrative, stored) -> None:
+        if stored is None:
+            return
+        await self.db.execute(
+            STORE_NARRATIVE_QUERY,
+            {
+                "collection_name": self.config["COLLECTION_NAME"],
+                "narrative": narrative,
+                "generated_at": stored.checked_at,
+            },
+        )
+
+    async def generate_last_session_narrative(self, n_previous_sessions_context=5, callbacks=None) -> str:
+        collection_name = await self.live_collection()
+
+        # Query the vector DB directly to retrieve documents based on metadata rather than vector search
+        sessions = await self.db.fetchall(
+            SESSION_TIMELINE_QUERY,
+            {"collection_name": collection_name, "limit": n_previous_sessions_context + 1},
+        )
+        last_session, previous_sessions = sessions[0], sessions[1:]
+        last_session_summary = last_session.document
+
+        # Join previous session summaries into a contiguous string in prepartion for prompt injection
+        previous_session_summaries = "\n".join([
+            f"-- SESSION {row.session_number} -- \n{row.document}"
+            for row in previous_sessions
+        ])
+
+        prompt = LAST_SESSION_PROMPT_TEMPLATE.format(
+            previous_summaries_context=previous_session_summaries,
+            last_session_context=last_session_summary,
+        )
+
+        async with self.answer_slots:
+            result = await self.streaming_llm.ainvoke(prompt, config={"callbacks": callbacks})
+
+        return result.content
@@ -0,0 +1,120 @@
+import asyncio
+import time
+from typing import Any, List, Optional
+
+import discord
+from langchain_core.callbacks import AsyncCallbackHandler
+
+DISCORD_MAX_MESSAGE_LENGTH = 2000
+CODE_BLOCK_OVERHEAD = 6  # Reserve 6 characters for the backticks of the quote block
+
+
+class DiscordStreamHandler(AsyncCallbackHandler):
+    """Streams LLM tokens into Discord replies as they are generated.
+
+    The first reply is sent as soon as the first token arrives, after which a
+    background task edits it at most once every ``edit_interval`` seconds so we
+    stay well inside Discord's message edit rate limits. When the text outgrows
+    a single message it is split on a line or sentence boundary and the rest
+    rolls over into a new reply.
+
+    Args:
+        reply_to (discord.Message): The message that triggered the command.
+        edit_interval (float): Minimum number of seconds between edits.
+        max_length (int): Discord's maximum message length.
+    """
+
+    def __init__(
+        self,
+        reply_to: discord.Message,
+        edit_interval: float = 1.0,
+        max_length: int = DISCORD_MAX_MESSAGE_LENGTH,
+    ) -> None:
+        self.reply_to = reply_to
+        self.edit_interval = edit_interval
+        self.max_content_length = max_length - CODE_BLOCK_OVERHEAD
+
+        self.text = ""
+        self.messages: List[discord.Message] = []
+        self.first_token_at: Optional[float] = None
+
+        self._started_at = time.perf_counter()
+        self._offset = 0  # Start of the current message within self.text
+        self._current_message: Optional[discord.Message] = None
+        self._shown = ""
+        self._flush_lock = asyncio.Lock()
+        self._finished = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+
+    async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        self.text += token
+        if self._flusher is None:
+            self.first_token_at = time.perf_counter() - self._started_at
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def finish(self, text: Optional[str] = None) -> None:
+        """Stop streaming and make sure the complete answer is visible.
+
+        :param text: The final answer. Replaces whatever was streamed, which also
+            covers answers that were produced without streaming any tokens.
+        """
+        self._finished.set()
+        if self._flusher is not None:
+            await self._flusher
+        if text is not None and text != self.text:
+            if not text.startswith(self.text[:self._offset]):
+                # The final answer diverged from what was already sent; start over
+                # with fresh messages rather than leaving a mismatched prefix behind.
+                self._offset = 0
+                self._current_message = None
+                self._shown = ""
+            self.text = text
+        await self._flush()
+
+    async def _flush_loop(self) -> None:
+        while not self._finished.is_set():
+            await self._flush()
+            try:
+                await asyncio.wait_for(self._finished.wait(), timeout=self.edit_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _flush(self) -> None:
+        async with self._flush_lock:
+            while True:
+                segment = self.text[self._offset:]
+                if len(segment) > self.max_content_length:
+                    cut = _split_point(segment, self.max_content_length)
+                    await self._show(segment[:cut])
+                    self._offset += cut
+                    self._current_message = None
+                    self._shown = ""
+                    continue
+                await self._show(segment)
+                break
+
+    async def _show(self, content: str) -> None:
+        content = content.strip()
+        if not content or content == self._shown:
+            return
+        reply_content = f"```{content}```"
+        if self._current_message is None:
+            self._current_message = await self.reply_to.reply(reply_content)
+            self.messages.append(self._current_message)
+        else:
+            await self._current_message.edit(content=reply_content)
+        self._shown = content
+
+
+def _split_point(text: str, limit: int) -> int:
+    """Find where to cut ``text`` so the first part fits in ``limit`` characters.
+
+    Prefers the last line break, then the last full stop, as long as that keeps
+    at least half of the message; otherwise cuts hard at the limit.
+    """
+    window = text[:limit]
+    for separator in ("\n", ". "):
+        idx = window.rfind(separator)
+        if idx >= limit // 2:
+            return idx + len(separator)
+    return limit
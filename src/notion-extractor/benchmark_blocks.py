@@ -0,0 +1,166 @@
+"""
+Benchmark the Notion block traversal against a local stub of the blocks API.
+
+Serves synthetic deep and wide pages (with more than 100 children, so
+start_cursor pagination is exercised), checks the loader rebuilds the exact
+expected text, and times it at different worker counts. Then checks the
+block cache picks up an edit to a nested block, which (as in Notion) moves
+the page's last_edited_time but not its parent block's.
+
+    python notion-extractor/benchmark_blocks.py --latency 0.05 --workers 1 4 8
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlparse
+
+import utils.MyNotionDBLoader as notion_db_loader
+from utils.MyNotionDBLoader import MyNotionDBLoader, _render_blocks
+from utils.block_cache import BlockCache
+
+# Blocks keep this timestamp even when a nested block under them is edited
+BLOCK_EDITED_TIME = "2024-01-01T00:00:00.000Z"
+# Block ids whose text has been edited, and their new text
+EDITED_TEXT: Dict[str, str] = {}
+
+
+def build_wide_page(n_blocks: int, nested_every: int, nested_children: int) -> Dict[str, List[str]]:
+    """A long page: many top-level blocks, some with a short nested list."""
+    tree = {"wide": [f"wide-{i}" for i in range(n_blocks)]}
+    for i in range(0, n_blocks, nested_every):
+        tree[f"wide-{i}"] = [f"wide-{i}-{j}" for j in range(nested_children)]
+    return tree
+
+
+def build_deep_page(depth: int, fan_out: int) -> Dict[str, List[str]]:
+    """A deeply nested page: every block has `fan_out` children down to `depth`."""
+    tree: Dict[str, List[str]] = {}
+    level = ["deep"]
+    for _ in range(depth):
+        next_level = []
+        for block_id in level:
+            tree[block_id] = [f"{block_id}-{i}" for i in range(fan_out)]
+            next_level.extend(tree[block_id])
+        level = next_level
+    return tree
+
+
+def block_json(block_id: str, tree: Dict[str, List[str]]) -> Dict[str, Any]:
+    return {
+        "id": block_id,
+        "type": "paragraph",
+        "has_children": block_id in tree,
+        "last_edited_time": BLOCK_EDITED_TIME,
+        "paragraph": {"rich_text": [{"text": {"content": EDITED_TEXT.get(block_id, f"text of {block_id}")}}]},
+    }
+
+
+def expected_text(block_id: str, tree: Dict[str, List[str]], num_tabs: int = 0) -> str:
+    lines = []
+    for child_id in tree[block_id]:
+        parts = ["\t" * num_tabs + f"text of {child_id}"]
+        if child_id in tree:
+            parts.append(expected_text(child_id, tree, num_tabs + 1))
+        lines.append("\n".join(parts))
+    return "\n".join(lines)
+
+
+def check_nested_edit(tree: Dict[str, List[str]], rps: float) -> bool:
+    """Load a page through the block cache, edit a block three levels down,
+    and check the reload picks the edit up, while an unchanged page is
+    served from disk without any requests."""
+    page, nested = "deep", "deep-0-0-0"
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cache = BlockCache(os.path.join(temp_dir, "blocks.sqlite"))
+        loader = MyNotionDBLoader("stub-token", "stub-database", verbose=False,
+                                  requests_per_second=rps, max_workers=8, block_cache=cache)
+
+        def load(page_edited_time: str):
+            before = loader.client.stats()["requests"]
+            text = _render_blocks(page, loader._fetch_tree(page, page_edited_time))
+            return text, loader.client.stats()["requests"] - before
+
+        load("2024-01-01T00:00:00.000Z")
+        _, unchanged_requests = load("2024-01-01T00:00:00.000Z")
+        EDITED_TEXT[nested] = "the nested block was edited"
+        # Notion moves the page's last_edited_time, not the edited block's parents'
+        text, edited_requests = load("2024-01-01T00:05:00.000Z")
+        EDITED_TEXT.clear()
+
+        ok = unchanged_requests == 0 and "the nested block was edited" in text
+        print(f"nested edit: unchanged page {unchanged_requests} requests, "
+              f"edited page {edited_requests} requests, edit {'picked up' if ok else 'MISSED'}")
+        print(f"Block cache stats: {cache.stats()}")
+        loader.close()
+        cache.close()
+    return ok
+
+
+def serve(tree: Dict[str, List[str]], latency: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            block_id = url.path.split("/")[-2]
+            query = parse_qs(url.query)
+            page_size = int(query.get("page_size", ["100"])[0])
+            start = int(query.get("start_cursor", ["0"])[0])
+            child_ids = tree.get(block_id, [])
+            end = start + page_size
+            body = {
+                "results": [block_json(child_id, tree) for child_id in child_ids[start:end]],
+                "has_more": end < len(child_ids),
+                "next_cursor": str(end) if end < len(child_ids) else None,
+            }
+            time.sleep(latency)
+            payload = json.dumps(body).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="benchmark_blocks.py", description="Benchmark Notion block traversal")
+    parser.add_argument("--latency", help="stub response latency in seconds", type=float, default=0.05)
+    parser.add_argument("--rps", help="loader rate limit (requests/s)", type=float, default=1000.0)
+    parser.add_argument("--workers", help="worker counts to compare", type=int, nargs="+", default=[1, 4, 8])
+    args = parser.parse_args()
+
+    tree = {**build_wide_page(350, 10, 3), **build_deep_page(6, 3)}
+    server = serve(tree, args.latency)
+    notion_db_loader.BLOCK_URL = f"http://127.0.0.1:{server.server_port}/v1/blocks/{{block_id}}/children"
+
+    try:
+        for page in ["wide", "deep"]:
+            expected = expected_text(page, tree)
+            for workers in args.workers:
+                loader = MyNotionDBLoader("stub-token", "stub-database", verbose=False,
+                                          requests_per_second=args.rps, max_workers=workers)
+                start = time.perf_counter()
+                text = _render_blocks(page, loader._fetch_tree(page))
+                elapsed = time.perf_counter() - start
+                status = "ok" if text == expected else "MISMATCH"
+                print(f"{page:>5} page, {workers:>2} workers: {elapsed:6.2f}s, "
+                      f"{loader.client.stats()['requests']} requests, text {status}")
+                loader.close()
+        check_nested_edit(tree, args.rps)
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
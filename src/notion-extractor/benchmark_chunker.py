@@ -0,0 +1,119 @@
+"""
+Benchmark the block chunker against the RecursiveCharacterTextSplitter on
+large synthetic session notes.
+
+Builds a session notes page as Notion blocks (headings per scene, bulleted
+lists with nested detail, paragraphs, dividers), renders it the way the
+loader does, and chunks it both ways. It reports time, chunk sizes, how many
+chunks start on a block boundary and how many run across a heading.
+
+    python notion-extractor/benchmark_chunker.py --scenes 400 --chunk-size 2000 --chunk-overlap 100
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+from typing import Any, Dict, List
+
+from langchain.docstore.document import Document
+
+from utils.MyNotionDBLoader import _block_units, _render_blocks, _units_text
+from utils.load_util import split_documents
+
+WORDS = ("the party met a hooded stranger in the tavern who spoke of an ancient dragon "
+         "beneath the mountain and a cult that worships it the paladin swore an oath "
+         "while the rogue quietly pocketed a silver key").split()
+
+
+def sentence(rng: random.Random, n_words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(n_words)).capitalize() + "."
+
+
+def block(block_id: str, block_type: str, text: str, has_children: bool = False) -> Dict[str, Any]:
+    return {
+        "id": block_id,
+        "type": block_type,
+        "has_children": has_children,
+        block_type: {"rich_text": [{"text": {"content": text}}]},
+    }
+
+
+def build_session_notes(scenes: int, seed: int = 0) -> Dict[str, List[Dict[str, Any]]]:
+    """Children lists of a session notes page, keyed by block id ("page" is the root)."""
+    rng = random.Random(seed)
+    children: Dict[str, List[Dict[str, Any]]] = {"page": []}
+    for scene in range(scenes):
+        top = children["page"]
+        if scene % 10 == 0:
+            top.append(block(f"h1-{scene}", "heading_1", f"Day {scene // 10 + 1}"))
+        top.append(block(f"h2-{scene}", "heading_2", f"Scene {scene}: {sentence(rng, 4)}"))
+        for i in range(rng.randint(2, 5)):
+            top.append(block(f"p-{scene}-{i}", "paragraph", " ".join(sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(1, 6)))))
+        for i in range(rng.randint(3, 8)):
+            bullet_id = f"b-{scene}-{i}"
+            nested = rng.random() < 0.4
+            top.append(block(bullet_id, "bulleted_list_item", sentence(rng, rng.randint(5, 15)), has_children=nested))
+            if nested:
+                children[bullet_id] = [
+                    block(f"{bullet_id}-{j}", "bulleted_list_item", sentence(rng, rng.randint(5, 12)))
+                    for j in range(rng.randint(1, 4))
+                ]
+        if rng.random() < 0.2:
+            top.append({"id": f"d-{scene}", "type": "divider", "has_children": False, "divider": {}})
+    return children
+
+
+def boundary_stats(chunks: List[Document], block_starts: set, heading_lines: set) -> Dict[str, float]:
+    starts_on_block = sum(chunk.page_content.split("\n", 1)[0] in block_starts for chunk in chunks)
+    crosses_heading = sum(
+        any(line in heading_lines for line in chunk.page_content.split("\n")[1:])
+        for chunk in chunks
+    )
+    sizes = [len(chunk.page_content) for chunk in chunks]
+    return {
+        "chunks": len(chunks),
+        "mean_chars": round(statistics.mean(sizes)),
+        "max_chars": max(sizes),
+        "starts_on_block": f"{starts_on_block / len(chunks):.0%}",
+        "crosses_heading": f"{crosses_heading / len(chunks):.0%}",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="benchmark_chunker.py", description="Benchmark the block chunker")
+    parser.add_argument("--scenes", help="scenes in the synthetic session notes", type=int, default=400)
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+    os.environ["CHUNK_SIZE"] = str(args.chunk_size)
+    os.environ["CHUNK_OVERLAP"] = str(args.chunk_overlap)
+
+    children = build_session_notes(args.scenes)
+    blocks = _block_units("page", children)
+    text = _units_text(blocks)
+    assert text == _render_blocks("page", children), "block units don't render to the page text"
+    print(f"Session notes: {len(children['page'])} top-level blocks, {len(text) / 1024:.0f} KiB of text\n")
+
+    block_starts = {unit["text"].split("\n", 1)[0] for unit in blocks if unit["text"]}
+    heading_lines = {unit["text"] for unit in blocks if unit["type"].startswith("heading_")}
+    metadata = {"id": "page", "name": "Session 1", "tags": ["Session Notes"]}
+
+    for name, make_doc in [
+        ("recursive splitter", lambda: Document(page_content=text, metadata=dict(metadata))),
+        ("block chunker", lambda: Document(page_content=text, metadata={**metadata, "blocks": blocks})),
+    ]:
+        timings = []
+        for _ in range(args.repeats):
+            doc = make_doc()
+            start = time.perf_counter()
+            chunks = split_documents([doc])
+            timings.append(time.perf_counter() - start)
+        print(f"{name:>18}: {statistics.median(timings) * 1000:7.1f} ms, "
+              f"{boundary_stats(chunks, block_starts, heading_lines)}")
+
+
+if __name__ == '__main__':
+    main()
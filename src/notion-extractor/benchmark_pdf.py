@@ -0,0 +1,130 @@
+"""
+Benchmark PDF ingestion against a local stub file server.
+
+Writes a synthetic many-page PDF, serves it with an ETag (like Notion's file
+storage), and times MyPyPDFLoader parsing it in-process and across a process
+pool, checking both extract the same text. It then loads it again through the
+PDF text cache, which should skip both the download and the parse.
+
+    python notion-extractor/benchmark_pdf.py --pages 400 --workers 1 4
+"""
+
+import argparse
+import hashlib
+import os
+import resource
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.MyPyPDFLoader import MyPyPDFLoader
+from utils.pdf_cache import PdfTextCache
+
+
+def write_pdf(path: str, n_pages: int, lines_per_page: int):
+    """A minimal text-only PDF, one Helvetica text object per page."""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # page tree, filled in once the page object numbers are known
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_numbers = []
+    for page in range(n_pages):
+        lines = [f"({'Rule %d.%d: the loremaster recalls an old tale of the realm.' % (page, line)}) Tj T*"
+                 for line in range(lines_per_page)]
+        stream = ("BT /F1 9 Tf 11 TL 36 800 Td " + " ".join(lines) + " ET").encode()
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_numbers.append(len(objects) + 1)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (len(objects)))
+    kids = " ".join(f"{number} 0 R" for number in page_numbers).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % n_pages
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            f.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+        for offset in offsets:
+            f.write(b"%010d 00000 n \n" % offset)
+        f.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+
+
+def serve(path: str) -> ThreadingHTTPServer:
+    with open(path, "rb") as f:
+        etag = '"%s"' % hashlib.md5(f.read()).hexdigest()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(os.path.getsize(path)))
+            self.send_header("ETag", etag)
+            self.end_headers()
+            try:
+                with open(path, "rb") as f:
+                    while chunk := f.read(64 * 1024):
+                        self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the client stopped reading after an ETag cache hit
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="benchmark_pdf.py", description="Benchmark PDF ingestion")
+    parser.add_argument("--pages", help="pages in the synthetic PDF", type=int, default=400)
+    parser.add_argument("--lines", help="text lines per page", type=int, default=60)
+    parser.add_argument("--workers", help="process counts to compare (1 parses in-process)", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        pdf_path = os.path.join(temp_dir, "rulebook.pdf")
+        write_pdf(pdf_path, args.pages, args.lines)
+        print(f"{args.pages} page PDF, {os.path.getsize(pdf_path) / 1024 / 1024:.1f} MiB")
+        server = serve(pdf_path)
+        url = f"http://127.0.0.1:{server.server_port}/files/rulebook.pdf?X-Amz-Signature=stub"
+
+        try:
+            expected = None
+            for workers in args.workers:
+                executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+                start = time.perf_counter()
+                pages = [doc.page_content for doc in MyPyPDFLoader(url, executor=executor, max_workers=workers).lazy_load()]
+                elapsed = time.perf_counter() - start
+                expected = expected or pages
+                status = "ok" if pages == expected and len(pages) == args.pages else "MISMATCH"
+                print(f"{workers:>2} workers: {elapsed:6.2f}s, {len(pages)} pages, text {status}")
+                if executor is not None:
+                    executor.shutdown()
+
+            cache = PdfTextCache(os.path.join(temp_dir, "pdf_text.sqlite"))
+            for attempt in ["cold", "warm"]:
+                start = time.perf_counter()
+                loader = MyPyPDFLoader(url, cache=cache)
+                pages = [doc.page_content for doc in loader.lazy_load()]
+                elapsed = time.perf_counter() - start
+                status = "ok" if pages == expected else "MISMATCH"
+                # On an ETag hit the body is never written to disk
+                downloaded = "downloaded" if os.path.exists(loader.file_path) else "download skipped"
+                print(f"{attempt} cache: {elapsed:6.2f}s, {downloaded}, text {status}")
+            print(f"PDF text cache stats: {cache.stats()}")
+            cache.close()
+        finally:
+            server.shutdown()
+
+    print(f"Peak RSS: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+
+
+if __name__ == '__main__':
+    main()
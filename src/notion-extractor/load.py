@@ -26,10 +26,57 @@ def cli():
                         help="verbose logging",
                         action="store_true")
     parser.add_argument("-r", "--reset",
-                        help="this will reset collection before loading",
+                        help="rebuild the collection from scratch (into a shadow collection that replaces the live one when done)",
                         action="store_true")
+    parser.add_argument("--daemon",
+                        help="keep running after the load and sync incrementally whenever Notion pages are edited",
+                        action="store_true")
+    parser.add_argument("--no-cache",
+                        help="fetch every Notion block from the API and re-parse every PDF instead of using the local caches",
+                        action="store_true")
+    parser.add_argument("--purge-cache",
+                        help="delete the local Notion block and PDF text caches before loading",
+                        action="store_true")
+    parser.add_argument("--embed-workers",
+                        help="embedding processes to spread ingest over (one per core)",
+                        type=int, default=1)
+    parser.add_argument("--embed-batch-size",
+                        help="texts per embedding batch",
+                        type=int, default=32)
+    parser.add_argument("--index",
+                        choices=['hnsw', 'ivfflat'],
+                        help="create an ANN index of this type on the embeddings after loading")
+    parser.add_argument("--rebuild-index",
+                        help="rebuild the ANN index even if it already exists (e.g. to apply new parameters)",
+                        action="store_true")
+    parser.add_argument("--index-only",
+                        help="skip fetching from Notion and only manage/report on the ANN index",
+                        action="store_true")
+    parser.add_argument("--hnsw-m",
+                        help="HNSW max connections per layer",
+                        type=int, default=16)
+    parser.add_argument("--hnsw-ef-construction",
+                        help="HNSW candidate list size used while building",
+                        type=int, default=64)
+    parser.add_argument("--ivfflat-lists",
+                        help="IVFFlat number of lists (default: rows / 1000)",
+                        type=int)
+    parser.add_argument("--index-report",
+                        help="compare exact vs ANN search latency and recall for the collection",
+                        action="store_true")
+    parser.add_argument("--check-indexes",
+                        help="EXPLAIN the hot metadata queries and check they use their indexes",
+                        action="store_true")
+    parser.add_argument("--ef-search",
+                        help="hnsw.ef_search to use for the index report",
+                        type=int)
+    parser.add_argument("--probes",
+                        help="ivfflat.probes to use for the index report",
+                        type=int)
 
     args = parser.parse_args()
+    if args.daemon and args.index_only:
+        parser.error("--daemon can't be combined with --index-only")
 
     # print(args)
 
@@ -41,6 +88,11 @@ def cli():
     print(f"  - fetching documents from: {args.source}")
     print(f"  - loading processed documents into: {args.target}")
     print(f"  - reset collection before loading: {args.reset}")
+    print(f"  - daemon mode: {args.daemon}")
+    print(f"  - embedding: {args.embed_workers} workers, batch size {args.embed_batch_size}")
+    print(f"  - Notion block and PDF caches: {'off' if args.no_cache else 'on'} (purge: {args.purge_cache})")
+    if args.index:
+        print(f"  - ANN index: {args.index} (rebuild: {args.rebuild_index})")
     print()
     return args
 
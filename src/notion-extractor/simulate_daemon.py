@@ -0,0 +1,175 @@
+"""
+Exercise the sync daemon's adaptive polling against a local stub of the
+Notion database query API.
+
+A scripted "editor" edits pages at set times (a burst, then a long idle
+stretch, then one late edit, including one while a sync is running). Like
+Notion, the stub rounds last_edited_time down to the minute, and all edits
+land in one minute, so every edit after the first is made in a minute that
+was already synced. The daemon runs with a stub sync that reloads the page
+only when the real change check says so. The script asserts every edit was
+synced, by exactly one more sync once the minute has settled, and reports how
+quickly, and how many polls that took compared with polling at the minimum
+interval throughout. It runs for two to three minutes.
+
+    python notion-extractor/simulate_daemon.py --min-interval 0.2 --max-interval 3
+"""
+
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+
+import utils.MyNotionDBLoader as notion_db_loader
+from utils.MyNotionDBLoader import EDIT_SETTLE_TIME, MyNotionDBLoader, needs_reload
+from utils.sync_daemon import AdaptivePoller, run_daemon
+
+
+class StubDatabase:
+    """Page edit times (rounded down to the minute, as Notion does), and the
+    number of database queries served."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.edits: List[str] = []
+        self.queries = 0
+
+    def edit(self) -> str:
+        with self.lock:
+            edited = datetime.now(timezone.utc).replace(second=0, microsecond=0).isoformat(timespec="milliseconds")
+            self.edits.append(edited.replace("+00:00", "Z"))
+            return self.edits[-1]
+
+    def snapshot(self) -> Tuple[Optional[str], int]:
+        """The page's last_edited_time and how many edits its content includes."""
+        with self.lock:
+            return (self.edits[-1] if self.edits else None), len(self.edits)
+
+    def latest(self) -> dict:
+        with self.lock:
+            self.queries += 1
+            if not self.edits:
+                return {"results": [], "has_more": False, "next_cursor": None}
+            return {
+                "results": [{"object": "page", "id": "page", "last_edited_time": self.edits[-1]}],
+                "has_more": False,
+                "next_cursor": None,
+            }
+
+
+def serve(database: StubDatabase) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            query = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            assert query.get("page_size") == 1 and query.get("sorts"), query
+            payload = json.dumps(database.latest()).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="simulate_daemon.py", description="Simulate the sync daemon's adaptive polling")
+    parser.add_argument("--min-interval", help="poll interval right after an edit (s)", type=float, default=0.2)
+    parser.add_argument("--max-interval", help="poll interval cap while idle (s)", type=float, default=3.0)
+    parser.add_argument("--sync-seconds", help="how long each stub sync takes (s)", type=float, default=0.5)
+    parser.add_argument("--settle-seconds", help="how long after its minute an edit time is final (s)", type=float,
+                        default=EDIT_SETTLE_TIME.total_seconds())
+    args = parser.parse_args()
+    settle_time = timedelta(seconds=args.settle_seconds)
+
+    # Seconds after start at which a page is edited
+    schedule = [1.0, 1.3, 1.6, 2.5, 12.0, 12.1]
+    # The edits' minute has to settle before its settling sync runs
+    duration = schedule[-1] + args.settle_seconds + 2 * args.max_interval
+
+    # Start early enough in a minute for every edit to land in it
+    seconds_into_minute = time.time() % 60
+    if seconds_into_minute + schedule[-1] > 55:
+        print(f"Waiting {60 - seconds_into_minute:.0f}s for the next minute to start")
+        time.sleep(60 - seconds_into_minute)
+
+    database = StubDatabase()
+    server = serve(database)
+    notion_db_loader.DATABASE_URL = f"http://127.0.0.1:{server.server_port}/v1/databases/{{database_id}}/query"
+    loader = MyNotionDBLoader("stub-token", "stub-database", verbose=False, requests_per_second=1000.0)
+
+    # (synced at, edits included) for every sync that reloaded the page
+    synced: List[tuple] = []
+    # Wall clock start of every sync the daemon ran
+    sync_starts: List[datetime] = []
+    stored = {}
+
+    def sync():
+        fetched_at = datetime.now(timezone.utc)
+        sync_starts.append(fetched_at)
+        latest, version = database.snapshot()
+        if latest is None:
+            return
+        edited = datetime.fromisoformat(latest.replace("Z", "+00:00"))
+        if "page" in stored and not needs_reload(edited, *stored["page"], settle_time=settle_time):
+            return
+        time.sleep(args.sync_seconds)
+        stored["page"] = (edited, fetched_at)
+        synced.append((time.monotonic(), version))
+
+    made: List[tuple] = []
+
+    def editor():
+        start = time.monotonic()
+        for at in schedule:
+            time.sleep(max(0.0, start + at - time.monotonic()))
+            made.append((time.monotonic(), database.edit()))
+
+    stop = threading.Event()
+    threading.Timer(duration, stop.set).start()
+    threading.Thread(target=editor, daemon=True).start()
+    try:
+        run_daemon(
+            latest_edit=loader.latest_edit_time,
+            sync=sync,
+            poller=AdaptivePoller(min_interval=args.min_interval, max_interval=args.max_interval),
+            resync_interval=duration * 2,
+            stop=stop,
+            settle_time=settle_time,
+        )
+    finally:
+        server.shutdown()
+
+    print()
+    missed = 0
+    for number, (edited_at, edit) in enumerate(made, start=1):
+        covering = [synced_at for synced_at, version in synced if version >= number]
+        if covering:
+            print(f"edit {number} at {edit}: synced after {covering[0] - edited_at:5.2f}s")
+        else:
+            missed += 1
+            print(f"edit {number} at {edit}: NOT SYNCED")
+    fixed_polls = int(duration / args.min_interval)
+    print(f"\n{len(synced)} page reloads, {database.queries} polls "
+          f"(fixed {args.min_interval}s polling: ~{fixed_polls}), {missed} edits missed")
+
+    assert missed == 0, f"{missed} edits were never synced"
+    edit_minute = datetime.fromisoformat(made[0][1].replace("Z", "+00:00"))
+    assert all(edit == made[0][1] for _, edit in made), "edits didn't all land in one minute"
+    # The first edit's sync, then exactly one settling sync for the edits after it
+    assert len(sync_starts) == 2, f"expected 2 syncs, the daemon ran {len(sync_starts)}"
+    assert sync_starts[1] >= edit_minute + settle_time, \
+        f"settling sync started at {sync_starts[1]}, before {edit_minute + settle_time}"
+    print("Settling sync ok: one extra sync, after the edits' minute settled")
+
+
+if __name__ == '__main__':
+    main()
@@ -3,14 +3,19 @@ Sourced from https://github.com/johntday/notion-utils/blob/main/notion_utils/MyN
 """
 
 """Notion DB loader for langchain"""
-import itertools
-import time
-from typing import Any, Dict, List
-import requests
+import multiprocessing
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
 from langchain.docstore.document import Document
 from langchain.document_loaders.base import BaseLoader
 
 from .MyPyPDFLoader import MyPyPDFLoader
+from .block_cache import BlockCache
+from .notion_client import NotionClient
+from .pdf_cache import PdfTextCache
 
 NOTION_BASE_URL = "https://api.notion.com/v1"
 DATABASE_URL = NOTION_BASE_URL + "/databases/{database_id}/query"
@@ -25,6 +30,9 @@ QUERY_DICT = {
     # },
     "page_size": 100,
 }
+# Notion rounds last_edited_time down to the minute, so a page's timestamp
+# only identifies its content once that minute (plus clock skew) has passed
+EDIT_SETTLE_TIME = timedelta(minutes=2)
 
 def _read_metadata(page_id: str,
                    page_summary: Dict[str, Any],
@@ -97,6 +105,127 @@ def _read_metadata(page_id: str,
     metadata["id"] = page_id
 
 
+def _is_hidden(metadata: Dict[str, Any]) -> bool:
+    """Pages with these statuses are not loaded."""
+    return 'status' in metadata and metadata["status"] in ["Archived", "Indexed"]
+
+
+def is_settled(last_edited_time: str, settle_time: timedelta = EDIT_SETTLE_TIME) -> bool:
+    """Whether no further edit can still land in this last_edited_time's minute."""
+    edited = datetime.fromisoformat(last_edited_time.replace("Z", "+00:00"))
+    return datetime.now(timezone.utc) - edited >= settle_time
+
+
+def needs_reload(last_edited: datetime,
+                 stored_last_edited: datetime,
+                 stored_fetched_at: Optional[datetime],
+                 settle_time: timedelta = EDIT_SETTLE_TIME,
+                 ) -> bool:
+    """Whether a page edited at last_edited is newer than its stored copy.
+
+    An equal timestamp still counts when the stored copy was fetched before
+    that minute settled, since a later edit in the same minute doesn't move
+    it. Copies stored without a fetch time are taken as settled.
+    """
+    if last_edited != stored_last_edited:
+        return last_edited > stored_last_edited
+    return stored_fetched_at is not None and stored_fetched_at < last_edited + settle_time
+
+
+def _is_file_block(result: Dict[str, Any]) -> bool:
+    return result["type"] == "file" or result["type"] == "pdf"
+
+
+def _file_url(result: Dict[str, Any]) -> str:
+    """Download url of a file or pdf block, whether uploaded to Notion or external."""
+    file_obj = result[result["type"]]
+    return file_obj[file_obj["type"]]["url"]
+
+
+def _is_pdf_block(result: Dict[str, Any]) -> bool:
+    return result["type"] == "pdf" or urlparse(_file_url(result)).path.lower().endswith(".pdf")
+
+
+def _child_blocks(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """The blocks whose children contribute to the page text."""
+    if any(_is_file_block(result) for result in results):
+        return []
+    return [
+        result for result in results
+        if result["has_children"] and "rich_text" in result[result["type"]]
+    ]
+
+
+def _render_block(result: Dict[str, Any],
+                  children: Dict[str, List[Dict[str, Any]]],
+                  num_tabs: int = 0,
+                  file_text: Callable[[Dict[str, Any]], str] = _file_url,
+                  ) -> Optional[str]:
+    """Text of one block and its nested children, or None for blocks without text."""
+    result_obj = result[result["type"]]
+    if "rich_text" not in result_obj:
+        return None
+
+    cur_result_text_arr: List[str] = []
+
+    for rich_text in result_obj["rich_text"]:
+        if "text" in rich_text:
+            cur_result_text_arr.append(
+                "\t" * num_tabs + rich_text["text"]["content"]
+            )
+
+    if result["has_children"]:
+        cur_result_text_arr.append(_render_blocks(result["id"], children, num_tabs + 1, file_text))
+
+    return "\n".join(cur_result_text_arr)
+
+
+def _render_blocks(block_id: str,
+                   children: Dict[str, List[Dict[str, Any]]],
+                   num_tabs: int = 0,
+                   file_text: Callable[[Dict[str, Any]], str] = _file_url,
+                   ) -> str:
+    """Rebuild a block's text from its fetched children, in document order.
+    A file or pdf block stands in for the whole block with file_text(block)
+    (by default its url)."""
+    result_lines_arr: List[str] = []
+
+    for result in children[block_id]:
+        if _is_file_block(result):
+            return file_text(result)
+        text = _render_block(result, children, num_tabs, file_text)
+        if text is not None:
+            result_lines_arr.append(text)
+
+    return "\n".join(result_lines_arr)
+
+
+def _block_units(block_id: str,
+                 children: Dict[str, List[Dict[str, Any]]],
+                 file_text: Callable[[Dict[str, Any]], str] = _file_url,
+                 ) -> List[Dict[str, Any]]:
+    """The top-level blocks of a page as {"type", "text"} units, each holding its
+    nested children, for the block chunker. Joined with newlines (see
+    _units_text) the texts are exactly _render_blocks' text; dividers are kept,
+    with no text, as section breaks."""
+    units: List[Dict[str, Any]] = []
+
+    for result in children[block_id]:
+        if _is_file_block(result):
+            return [{"type": result["type"], "text": file_text(result)}]
+        text = _render_block(result, children, 0, file_text)
+        if text is not None:
+            units.append({"type": result["type"], "text": text})
+        elif result["type"] == "divider":
+            units.append({"type": "divider", "text": None})
+
+    return units
+
+
+def _units_text(units: List[Dict[str, Any]]) -> str:
+    return "\n".join(unit["text"] for unit in units if unit["text"] is not None)
+
+
 class MyNotionDBLoader(BaseLoader):
     """Notion DB Loader.
     Reads content from pages within a Noton Database.
@@ -105,8 +234,14 @@ class MyNotionDBLoader(BaseLoader):
         database_id (str): Notion database id.
         verbose (bool): Whether to print debug messages.
         timeout (int): Timeout for requests to Notion API.
-        wait (int): Wait time between retries.
+        wait (int): Base backoff between retries.
         retry_count (int): Number of retries.
+        requests_per_second (float): Request rate shared by all workers.
+        max_workers (int): Number of pages fetched concurrently.
+        block_cache (BlockCache): Optional on-disk cache of block children.
+        max_pending_pages (int): Pages fetched ahead of the consumer by lazy_load.
+        pdf_cache (PdfTextCache): Optional on-disk cache of extracted PDF text.
+        pdf_workers (int): Processes PDF pages are extracted on; 1 parses in-process.
         metadata_filter_list (list[str]): List of metadata to keep.
         validate_missing_content (bool): Whether to validate missing content.
         validate_missing_metadata (list[str]): List of metadata to validate.
@@ -122,6 +257,12 @@ class MyNotionDBLoader(BaseLoader):
                  metadata_filter_list: list[str] = ['id', 'title'],
                  validate_missing_content: bool = True,
                  validate_missing_metadata: list[str] = ['source'],
+                 requests_per_second: float = 3.0,
+                 max_workers: int = 4,
+                 block_cache: Optional[BlockCache] = None,
+                 max_pending_pages: int = 16,
+                 pdf_cache: Optional[PdfTextCache] = None,
+                 pdf_workers: int = 1,
                  ) -> None:
         """Initialize with parameters."""
         if not integration_token:
@@ -143,22 +284,80 @@ class MyNotionDBLoader(BaseLoader):
         self.metadata_filter_list = metadata_filter_list
         self.validate_missing_content = validate_missing_content
         self.validate_missing_metadata = validate_missing_metadata
+        self.max_workers = max_workers
+        self.block_executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.block_cache = block_cache
+        self.max_pending_pages = max(max_pending_pages, max_workers)
+        self.pdf_cache = pdf_cache
+        self.pdf_workers = pdf_workers
+        # Spawned rather than forked, since the loader's threads may hold locks
+        self.pdf_executor = ProcessPoolExecutor(
+            max_workers=pdf_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        ) if pdf_workers > 1 else None
+        # Ids of the pages in the database that should be loaded, as of the last lazy_load
+        self.live_page_ids: Optional[Set[str]] = None
+        self.client = NotionClient(
+            self.headers,
+            requests_per_second=requests_per_second,
+            timeout=timeout,
+            retry_count=retry_count,
+            wait=wait,
+            pool_size=max_workers,
+        )
 
     def load(self,
              query_dict: Dict[str, Any] = QUERY_DICT,
-             is_test_only: bool = False
+             is_test_only: bool = False,
+             page_filter: Optional[Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]] = None,
              ) -> List[Document]:
         """Load documents from the Notion database.
         Args:
             query_dict (Dict[str, Any]): Query dict for Notion API.
+            page_filter (Callable): Narrows the database query results down to the
+                pages whose blocks should be fetched, e.g. only those edited since
+                the last load.
         Returns:
             List[Document]: List of documents.
         """
-        page_summaries = self._retrieve_page_summaries(query_dict)
-        print(f"Found {len(page_summaries)} pages in Notion database {self.database_id}\n")
         if is_test_only:
+            page_summaries = self._retrieve_page_summaries(query_dict)
+            print(f"Found {len(page_summaries)} pages in Notion database {self.database_id}\n")
             return []
-        return list(itertools.chain.from_iterable(self.load_page(page_summary) for page_summary in page_summaries))
+        return list(self.lazy_load(query_dict, page_filter=page_filter))
+
+    def lazy_load(self,
+                  query_dict: Dict[str, Any] = QUERY_DICT,
+                  page_filter: Optional[Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]] = None,
+                  ) -> Iterator[Document]:
+        """Yield documents in database order as their pages finish loading.
+        At most max_pending_pages are fetched ahead of the consumer, so a slow
+        consumer (e.g. embedding) holds back fetching instead of piling up pages.
+        """
+        page_summaries = self._retrieve_page_summaries(query_dict)
+        print(f"Found {len(page_summaries)} pages in Notion database {self.database_id}\n")
+        self.live_page_ids = {
+            page_summary["id"] for page_summary in page_summaries
+            if not _is_hidden(self.page_metadata(page_summary))
+        }
+        if page_filter is not None:
+            page_summaries = page_filter(page_summaries)
+            print(f"Fetching content for {len(page_summaries)} new or changed pages\n")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = deque()
+            for page_summary in page_summaries:
+                pending.append(executor.submit(self.load_page, page_summary))
+                if len(pending) >= self.max_pending_pages:
+                    yield from pending.popleft().result()
+            while pending:
+                yield from pending.popleft().result()
+
+        print(f"Notion API stats: {self.client.stats()}")
+        if self.block_cache is not None:
+            print(f"Block cache stats: {self.block_cache.stats()}")
+        if self.pdf_cache is not None:
+            print(f"PDF text cache stats: {self.pdf_cache.stats()}")
 
     def _retrieve_page_summaries(
             self,
@@ -166,6 +365,7 @@ class MyNotionDBLoader(BaseLoader):
     ) -> List[Dict[str, Any]]:
         """Get all the pages from a Notion database."""
         pages: List[Dict[str, Any]] = []
+        query_dict = dict(query_dict)
 
         while True:
             data = self._request(
@@ -183,6 +383,20 @@ class MyNotionDBLoader(BaseLoader):
 
         return pages
 
+    def latest_edit_time(self) -> Optional[str]:
+        """last_edited_time of the most recently edited page, in one request.
+        (The database object's own last_edited_time only moves on schema edits.)"""
+        data = self._request(
+            DATABASE_URL.format(database_id=self.database_id),
+            method="POST",
+            query_dict={
+                "sorts": [{"timestamp": "last_edited_time", "direction": "descending"}],
+                "page_size": 1,
+            },
+        )
+        results = data.get("results") or []
+        return results[0]["last_edited_time"] if results else None
+
     def duplicates(
             self,
             query_dict: Dict[str, Any] = {}
@@ -197,6 +411,14 @@ class MyNotionDBLoader(BaseLoader):
         duplicate_tuples = [t for t in list_items if t[1] in duplicates]
         return duplicate_tuples
 
+    def page_metadata(self,
+                      page_summary: Dict[str, Any]
+                      ) -> Dict[str, Any]:
+        """Read a page's properties from its database query result."""
+        metadata: Dict[str, Any] = {}
+        _read_metadata(page_summary["id"], page_summary, metadata)
+        return metadata
+
     def load_page(self,
                   page_summary: Dict[str, Any]
                   ) -> List[Document]:
@@ -209,8 +431,15 @@ class MyNotionDBLoader(BaseLoader):
         # Extract metadata
         _read_metadata(page_id, page_summary, metadata)
 
-        # Load all blocks of content
-        page_content = self._load_blocks(block_id=page_id)
+        # Check status of page before fetching any of its blocks
+        if _is_hidden(metadata):
+            return []
+
+        # Load all blocks of content, keeping the top-level blocks for the chunker
+        fetched_at = datetime.now(timezone.utc).isoformat(timespec="milliseconds")
+        children = self._fetch_tree(block_id=page_id, last_edited_time=page_summary.get("last_edited_time"))
+        blocks = _block_units(page_id, children, file_text=self._file_text)
+        page_content = _units_text(blocks)
 
         # Validate presence of page content and of metadata keys
         if not page_content and self.validate_missing_content:
@@ -221,55 +450,101 @@ class MyNotionDBLoader(BaseLoader):
                     raise ValueError(
                         f"Missing metadata: '{missing_metadata}' for page_id: '{page_id}', metadata: '{metadata}'")
 
-        # Check status of page
-        if 'status' in metadata and metadata["status"] in ["Archived", "Indexed"]:
-            return []
-
         # Filter metadata
         metadata_filtered = {k: v for k, v in metadata.items() if any(x == k for x in self.metadata_filter_list)}
 
         print(f"Loading Notion Page '{metadata_filtered}'\n")
 
-        return [Document(id=page_id, page_content=page_content, metadata=metadata_filtered)]
-
-    def _load_blocks(self,
-                     block_id: str,
-                     num_tabs: int = 0
-                     ) -> str:
-        """Read a block and its children."""
-        result_lines_arr: List[str] = []
-        cur_block_id: str = block_id
+        # Lets the next sync tell whether this copy saw every edit in its last_edited_time minute
+        metadata_filtered["fetched_at"] = fetched_at
 
-        while cur_block_id:
-            data = self._request(BLOCK_URL.format(block_id=cur_block_id))
+        # "blocks" is consumed (and removed) by split_documents before anything is stored
+        metadata_filtered["blocks"] = blocks
 
-            for result in data["results"]:
-                result_obj = result[result["type"]]
-
-                if result["type"] == "file" or result["type"] == "pdf":
-                    return result["file"]["file"]["url"]
-                if "rich_text" not in result_obj:
-                    continue
+        return [Document(id=page_id, page_content=page_content, metadata=metadata_filtered)]
 
-                cur_result_text_arr: List[str] = []
+    def _fetch_tree(self,
+                    block_id: str,
+                    last_edited_time: Optional[str] = None,
+                    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Fetch the children lists of a block and all its descendants, by block id.
+
+        Children lists are fetched on the shared block executor as soon as
+        their parent's list is known, so sibling subtrees download in parallel
+        (still under the client's rate limit).
+
+        With a block cache, every children list in the tree is keyed by the
+        page's last_edited_time: editing a nested block doesn't touch its
+        parent's last_edited_time, but it does move the page's, so an edit
+        anywhere re-fetches the whole tree and an unchanged page is read
+        entirely from disk. Pages edited within EDIT_SETTLE_TIME bypass the
+        cache, since another edit may still land on the same timestamp.
+        """
+        if last_edited_time is not None and not is_settled(last_edited_time):
+            last_edited_time = None
+        children: Dict[str, List[Dict[str, Any]]] = {}
+        pending = {self.block_executor.submit(self._fetch_children, block_id, last_edited_time): block_id}
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                parent_id = pending.pop(future)
+                children[parent_id] = future.result()
+                for child in _child_blocks(children[parent_id]):
+                    future = self.block_executor.submit(self._fetch_children, child["id"], last_edited_time)
+                    pending[future] = child["id"]
+
+        return children
+
+    def _file_text(self,
+                   result: Dict[str, Any]
+                   ) -> str:
+        """Text of a PDF block, parsed from the file; other files are represented by their url."""
+        if not _is_pdf_block(result):
+            return _file_url(result)
+        pdf_loader = MyPyPDFLoader(
+            _file_url(result),
+            verbose=self.verbose,
+            cache=self.pdf_cache,
+            executor=self.pdf_executor,
+            max_workers=self.pdf_workers,
+        )
+        return "\n".join(doc.page_content for doc in pdf_loader.lazy_load())
+
+    def _fetch_children(self,
+                        block_id: str,
+                        last_edited_time: Optional[str] = None,
+                        ) -> List[Dict[str, Any]]:
+        """Fetch every child of a block, following start_cursor pagination.
+        last_edited_time is the page's, and keys the cache entry (see _fetch_tree)."""
+        use_cache = self.block_cache is not None and last_edited_time is not None
+        if use_cache:
+            cached = self.block_cache.get(block_id, last_edited_time)
+            if cached is not None:
+                return cached
+
+        results: List[Dict[str, Any]] = []
+        params: Dict[str, Any] = {"page_size": 100}
 
-                for rich_text in result_obj["rich_text"]:
-                    if "text" in rich_text:
-                        cur_result_text_arr.append(
-                            "\t" * num_tabs + rich_text["text"]["content"]
-                        )
+        while True:
+            data = self.client.request(BLOCK_URL.format(block_id=block_id), params=params)
+            results.extend(data["results"])
 
-                if result["has_children"]:
-                    children_text = self._load_blocks(
-                        block_id=result["id"], num_tabs=num_tabs + 1
-                    )
-                    cur_result_text_arr.append(children_text)
+            if not data.get("has_more"):
+                break
 
-                result_lines_arr.append("\n".join(cur_result_text_arr))
+            params["start_cursor"] = data.get("next_cursor")
 
-            cur_block_id = data.get("next_cursor")
+        # Notion's file urls expire after an hour, so children lists holding
+        # files are always re-fetched (the PDF cache spares the re-parse)
+        if use_cache and not any(_is_file_block(result) for result in results):
+            self.block_cache.put(block_id, last_edited_time, results)
+        return results
 
-        return "\n".join(result_lines_arr)
+    def close(self):
+        self.block_executor.shutdown()
+        if self.pdf_executor is not None:
+            self.pdf_executor.shutdown()
 
     def _request(
             self,
@@ -277,26 +552,5 @@ class MyNotionDBLoader(BaseLoader):
             method: str = "GET",
             query_dict: Dict[str, Any] = {}
     ) -> Any:
-        """ Make a request to the Notion API.
-        Include retry logic and rate limit handling. """
-        # https://scrapeops.io/python-web-scraping-playbook/python-requests-retry-failed-requests/
-        for i in range(self.retry_count):
-            time.sleep(i * self.wait + 1)
-
-            try:
-                response = requests.request(
-                    method,
-                    url,
-                    headers=self.headers,
-                    json=query_dict,
-                    timeout=self.timeout,
-                )
-                # response.raise_for_status()
-                if response.status_code in [429, 500, 502, 503, 504]:
-                    print(f"Got {response.status_code} from Notion API. Retrying...")
-                    continue
-                return response.json()
-            # except requests.exceptions.ConnectionError:
-            except:
-                continue
-        raise ValueError(f"Failed to get response from Notion API after {self.retry_count} retries")
\ No newline at end of file
+        """Make a request to the Notion API through the shared rate limited client."""
+        return self.client.request(url, method=method, query_dict=query_dict)
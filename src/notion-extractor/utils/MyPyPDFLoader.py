@@ -2,9 +2,12 @@
 Sourced from https://github.com/johntday/notion-utils/blob/main/notion_utils/MyPyPDFLoader.py
 """
 
+import hashlib
 import os
 import tempfile
 from abc import ABC
+from collections import deque
+from concurrent.futures import Executor
 from typing import Iterator, List, Optional, Union, Dict
 from urllib.parse import urlparse
 
@@ -14,25 +17,53 @@ from langchain_community.document_loaders.parsers import PyPDFParser
 from langchain.schema import Document
 from langchain.document_loaders.base import BaseLoader
 
+from .pdf_cache import PdfTextCache, content_hash_key, etag_key
+
+# Downloads are streamed to disk in chunks of this size
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# Pages handed to a pool worker per task
+PAGES_PER_TASK = 8
+
+
+def _extract_page_range(file_path: str,
+                        password: Optional[Union[str, bytes]],
+                        start: int,
+                        stop: int,
+                        ) -> List[str]:
+    """Extract the text of pages [start, stop) (runs in a pool worker).
+    Each worker opens the file itself, so only page texts cross processes."""
+    import pypdf
+
+    reader = pypdf.PdfReader(file_path, password=password)
+    return [reader.pages[i].extract_text().strip() for i in range(start, stop)]
+
 
 class MyBasePDFLoader(BaseLoader, ABC):
     """Base Loader class for `PDF` files.
 
     If the file is a web path, it will download it to a temporary file, use it, then
         clean up the temporary file after completion.
+    With a cache, the keys the file's text is cached under (its ETag and the
+        sha256 of its bytes) are collected as it downloads, and the download is
+        skipped altogether when the ETag is already cached.
     """
 
-    def __init__(self, file_path: str, *, headers: Optional[Dict] = None, verbose: bool = False):
+    def __init__(self, file_path: str, *, headers: Optional[Dict] = None, verbose: bool = False,
+                 cache: Optional[PdfTextCache] = None):
         """Initialize with a file path.
 
         Args:
             file_path: Either a local, S3 or web path to a PDF file.
             headers: Headers to use for GET request to download a file from a web path.
+            cache: Optional cache of extracted page texts.
         """
         self.file_path = file_path
         self.web_path = None
         self.headers = headers
         self.verbose = verbose
+        self.cache = cache
+        self.cache_keys: List[str] = []
+        self.cached_pages: Optional[List[str]] = None
 
         if "~" in self.file_path:
             self.file_path = os.path.expanduser(self.file_path)
@@ -46,18 +77,47 @@ class MyBasePDFLoader(BaseLoader, ABC):
             print(f"temp_pdf: {temp_pdf}") if verbose else None
             self.web_path = self.file_path
             if not self._is_s3_url(self.file_path):
-                r = requests.get(self.file_path, headers=self.headers)
-                if r.status_code != 200:
-                    raise ValueError(
-                        "Check the url of your file; returned status code %s"
-                        % r.status_code
-                    )
-
-                with open(temp_pdf, mode="wb") as f:
-                    f.write(r.content)
+                self._download(self.file_path, temp_pdf)
                 self.file_path = str(temp_pdf)
         elif not os.path.isfile(self.file_path):
             raise ValueError("File path %s is not a valid file or url" % self.file_path)
+        elif self.cache is not None:
+            self._hash_local_file()
+
+    def _download(self, url: str, temp_pdf: str):
+        """Stream the file to disk, hashing it on the way, so memory stays bounded
+        whatever its size."""
+        with requests.get(url, headers=self.headers, stream=True, timeout=60) as r:
+            if r.status_code != 200:
+                raise ValueError(
+                    "Check the url of your file; returned status code %s"
+                    % r.status_code
+                )
+            etag = r.headers.get("ETag")
+            if self.cache is not None and etag:
+                self.cache_keys.append(etag_key(etag))
+                self.cached_pages = self.cache.get(self.cache_keys[0])
+                if self.cached_pages is not None:
+                    return
+
+            digest = hashlib.sha256()
+            with open(temp_pdf, mode="wb") as f:
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+        if self.cache is not None:
+            self._add_content_hash_key(digest.hexdigest())
+
+    def _hash_local_file(self):
+        digest = hashlib.sha256()
+        with open(self.file_path, mode="rb") as f:
+            for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        self._add_content_hash_key(digest.hexdigest())
+
+    def _add_content_hash_key(self, sha256: str):
+        self.cache_keys.append(content_hash_key(sha256))
+        self.cached_pages = self.cache.get(self.cache_keys[-1])
 
     def __del__(self) -> None:
         if hasattr(self, "temp_dir"):
@@ -88,7 +148,9 @@ class MyBasePDFLoader(BaseLoader, ABC):
 class MyPyPDFLoader(MyBasePDFLoader):
     """Load `PDF using `pypdf` and chunks at character level.
 
-    Loader also stores page numbers in metadata.
+    Loader also stores page numbers in metadata. Given an executor (a process
+    pool), pages are extracted in ranges across its workers, with a bounded
+    number of ranges in flight, and yielded in page order.
     """
 
     def __init__(
@@ -97,6 +159,9 @@ class MyPyPDFLoader(MyBasePDFLoader):
             password: Optional[Union[str, bytes]] = None,
             headers: Optional[Dict] = None,
             verbose: bool = False,
+            cache: Optional[PdfTextCache] = None,
+            executor: Optional[Executor] = None,
+            max_workers: int = 1,
     ) -> None:
         """Initialize with a file path."""
         try:
@@ -106,7 +171,10 @@ class MyPyPDFLoader(MyBasePDFLoader):
                 "pypdf package not found, please install it with " "`pip install pypdf`"
             )
         self.parser = PyPDFParser(password=password)
-        super().__init__(file_path, headers=headers, verbose=verbose)
+        self.password = password
+        self.executor = executor
+        self.max_workers = max_workers
+        super().__init__(file_path, headers=headers, verbose=verbose, cache=cache)
 
     def load(self) -> List[Document]:
         """Load given path as pages."""
@@ -116,5 +184,30 @@ class MyPyPDFLoader(MyBasePDFLoader):
             self,
     ) -> Iterator[Document]:
         """Lazy load given path as pages."""
-        blob = Blob.from_path(self.file_path)
-        yield from self.parser.parse(blob)
\ No newline at end of file
+        if self.cached_pages is not None:
+            print(f"Using cached text of {self.source}") if self.verbose else None
+            pages = self.cached_pages
+        else:
+            if self.executor is not None:
+                pages = list(self._extract_pages())
+            else:
+                pages = [doc.page_content for doc in self.parser.parse(Blob.from_path(self.file_path))]
+            if self.cache is not None:
+                self.cache.put(self.cache_keys, pages)
+
+        for page_number, text in enumerate(pages):
+            yield Document(page_content=text, metadata={"source": self.source, "page": page_number})
+
+    def _extract_pages(self) -> Iterator[str]:
+        import pypdf
+
+        n_pages = len(pypdf.PdfReader(self.file_path, password=self.password).pages)
+        pending = deque()
+        for start in range(0, n_pages, PAGES_PER_TASK):
+            pending.append(self.executor.submit(
+                _extract_page_range, self.file_path, self.password, start, min(start + PAGES_PER_TASK, n_pages)
+            ))
+            if len(pending) >= 2 * self.max_workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
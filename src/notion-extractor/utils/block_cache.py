@@ -0,0 +1,79 @@
+"""
+On-disk cache of Notion block children, keyed by block id and page last_edited_time
+"""
+
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from .sqlite_cache import SqliteLruCache, purge_cache_file
+
+BLOCK_CACHE_DDL = """
+    CREATE TABLE IF NOT EXISTS block_children (
+        block_id TEXT PRIMARY KEY,
+        last_edited_time TEXT NOT NULL,
+        children TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        accessed_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_block_children_accessed_at ON block_children (accessed_at);
+"""
+
+
+def purge_block_cache(path: str):
+    """Delete the cache file (and SQLite's WAL/shared-memory side files)."""
+    purge_cache_file(path, "Notion block cache")
+
+
+class BlockCache(SqliteLruCache):
+    """SQLite-backed cache of the children list of each Notion block.
+
+    An entry is only served when the last_edited_time of the page the block
+    belongs to matches the one it was stored with. The page's timestamp moves
+    on an edit anywhere in it, whereas a block's own timestamp doesn't move
+    when a nested block is edited. Each block keeps only its latest version,
+    and the least recently used entries are evicted once the cache grows past
+    max_bytes.
+    Args:
+        path (str): Path of the SQLite file.
+        max_bytes (int): Size bound on the cached children JSON.
+    """
+
+    TABLE = "block_children"
+    DDL = BLOCK_CACHE_DDL
+    KEY_COLUMN = "block_id"
+
+    def __init__(self,
+                 path: str,
+                 max_bytes: int = 256 * 1024 * 1024,
+                 ) -> None:
+        super().__init__(path, max_bytes)
+
+    def get(self, block_id: str, last_edited_time: str) -> Optional[List[Dict[str, Any]]]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT children FROM block_children WHERE block_id = ? AND last_edited_time = ?",
+                (block_id, last_edited_time),
+            ).fetchone()
+            if row is None:
+                self.cache_stats["misses"] += 1
+                return None
+            self.conn.execute(
+                "UPDATE block_children SET accessed_at = ? WHERE block_id = ?",
+                (time.time(), block_id),
+            )
+            self.conn.commit()
+            self.cache_stats["hits"] += 1
+            return json.loads(row[0])
+
+    def put(self, block_id: str, last_edited_time: str, children: List[Dict[str, Any]]):
+        payload = json.dumps(children)
+        with self.lock:
+            previous = self.conn.execute(
+                "SELECT size FROM block_children WHERE block_id = ?", (block_id,)
+            ).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO block_children VALUES (?, ?, ?, ?, ?)",
+                (block_id, last_edited_time, payload, len(payload), time.time()),
+            )
+            self._record_writes(1, len(payload) - (previous[0] if previous else 0))
@@ -0,0 +1,125 @@
+"""
+Chunker that splits Notion pages along their block structure
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+from langchain.docstore.document import Document
+
+HEADING_LEVELS = {"heading_1": 1, "heading_2": 2, "heading_3": 3}
+# Blocks that end the current chunk without changing the heading path
+SECTION_BREAK_TYPES = {"divider"}
+# Where an oversized block is split, from coarsest to finest
+OVERSIZED_SEPARATORS = ("\n", ". ", " ")
+
+
+def split_oversized(text: str,
+                    chunk_size: int,
+                    separators: Sequence[str] = OVERSIZED_SEPARATORS,
+                    ) -> List[str]:
+    """Split text longer than chunk_size greedily at the coarsest separator
+    that gets every piece under the limit (lines, then sentences, then words),
+    falling back to fixed-width slices."""
+    if len(text) <= chunk_size:
+        return [text]
+    if not separators:
+        return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+    separator, finer = separators[0], separators[1:]
+    pieces: List[str] = []
+    current = ""
+    for part in text.split(separator):
+        for sub in split_oversized(part, chunk_size, finer):
+            candidate = current + separator + sub if current else sub
+            if len(candidate) <= chunk_size:
+                current = candidate
+            else:
+                pieces.append(current)
+                current = sub
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def chunk_blocks(blocks: List[Dict[str, Any]],
+                 metadata: Dict[str, Any],
+                 chunk_size: int,
+                 chunk_overlap: int = 0,
+                 ) -> List[Document]:
+    """Chunk a page from its top-level blocks in one pass.
+
+    A chunk never crosses a heading or divider, and a block (with its nested
+    children) is only split if it alone is bigger than chunk_size, or if it
+    is the first block under a heading and doesn't fit beside it. Otherwise
+    consecutive blocks are packed greedily up to chunk_size, with up to
+    chunk_overlap characters of whole trailing blocks repeated at the start
+    of the next chunk of the same section. Each chunk records the heading
+    path it falls under in metadata["section"].
+    Args:
+        blocks (list): {"type", "text"} units in page order (text is None for dividers).
+        metadata (dict): Metadata copied onto every chunk.
+        chunk_size (int): Maximum characters per chunk.
+        chunk_overlap (int): Maximum characters carried over between chunks.
+    """
+    chunks: List[Document] = []
+    headings: List[str] = []
+    current: List[str] = []
+    current_len = 0
+    # Pieces of current that weren't carried over from the previous chunk
+    n_fresh = 0
+    # The heading that opened the current section, as its first chunk piece
+    heading_piece: Optional[str] = None
+
+    def flush(overlap: bool):
+        nonlocal current, current_len, n_fresh
+        if n_fresh:
+            chunk_metadata = dict(metadata)
+            if headings:
+                chunk_metadata["section"] = " > ".join(headings)
+            chunks.append(Document(page_content="\n".join(current), metadata=chunk_metadata))
+
+        carried: List[str] = []
+        carried_len = 0
+        if overlap and n_fresh:
+            for piece in reversed(current):
+                if carried_len + len(piece) + 1 > chunk_overlap:
+                    break
+                carried.insert(0, piece)
+                carried_len += len(piece) + 1
+        current, current_len, n_fresh = carried, carried_len, 0
+
+    for block in blocks:
+        level = HEADING_LEVELS.get(block["type"])
+        if level is not None or block["type"] in SECTION_BREAK_TYPES:
+            flush(overlap=False)
+            if level is not None:
+                title = _first_line(block["text"])
+                headings = headings[:level - 1] + ([title] if title else [])
+        if not block["text"]:
+            continue
+
+        budget = chunk_size
+        if current == [heading_piece] and current_len + len(block["text"]) > chunk_size \
+                and current_len <= chunk_size // 2:
+            # Split the first block under a heading small enough to share a
+            # chunk with it, rather than leave the heading on its own
+            budget = chunk_size - current_len
+        for piece in split_oversized(block["text"], budget):
+            if current_len + len(piece) > chunk_size:
+                if n_fresh:
+                    flush(overlap=True)
+                if current_len + len(piece) > chunk_size:
+                    # The carried-over blocks don't leave room for this one
+                    current, current_len, n_fresh = [], 0, 0
+            if level is not None and not current:
+                heading_piece = piece
+            current.append(piece)
+            current_len += len(piece) + 1
+            n_fresh += 1
+
+    flush(overlap=False)
+    return chunks
+
+
+def _first_line(text: Optional[str]) -> str:
+    return text.strip().split("\n", 1)[0] if text else ""
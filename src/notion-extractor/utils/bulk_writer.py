@@ -0,0 +1,183 @@
+"""
+Bulk writer for langchain_pg_embedding using binary COPY
+"""
+
+import time
+import uuid
+from typing import Any, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+from langchain_core.embeddings import Embeddings
+from pgvector.psycopg import register_vector
+from psycopg import Connection
+from psycopg.types.json import Jsonb
+
+from .db import Database
+
+COLLECTION_ID_QUERY = """
+    SELECT uuid
+    FROM langchain_pg_collection
+    WHERE name = %(collection_name)s;
+"""
+
+# COPY can't resolve conflicts, so rows land in a per-transaction staging table
+# first and are upserted from there on id, like PGVector.add_documents does.
+# Ids are scoped to their collection (see row_id), and a conflicting row from
+# another collection is never taken over
+CREATE_STAGING_TABLE = """
+    CREATE TEMP TABLE loremaster_embedding_staging
+        (LIKE langchain_pg_embedding)
+        ON COMMIT DROP;
+"""
+
+COPY_STAGING_ROWS = """
+    COPY loremaster_embedding_staging (id, collection_id, embedding, document, cmetadata)
+    FROM STDIN WITH (FORMAT BINARY)
+"""
+
+UPSERT_STAGED_ROWS = """
+    INSERT INTO langchain_pg_embedding (id, collection_id, embedding, document, cmetadata)
+    SELECT id, collection_id, embedding, document, cmetadata
+    FROM loremaster_embedding_staging
+    ON CONFLICT (id) DO UPDATE
+        SET embedding = EXCLUDED.embedding,
+            document = EXCLUDED.document,
+            cmetadata = EXCLUDED.cmetadata
+        WHERE langchain_pg_embedding.collection_id = EXCLUDED.collection_id;
+"""
+
+
+# Every row of the given pages except the ones being kept
+DELETE_PAGE_ROWS_QUERY = """
+    DELETE FROM langchain_pg_embedding embeddings
+    USING langchain_pg_collection collection
+    WHERE embeddings.collection_id = collection.uuid
+    AND collection.name = %(collection_name)s
+    AND embeddings.cmetadata->>'id' = ANY(%(page_ids)s)
+    AND embeddings.id <> ALL(%(keep_ids)s);
+"""
+
+UPDATE_METADATA_QUERY = """
+    UPDATE langchain_pg_embedding
+    SET cmetadata = %(cmetadata)s
+    WHERE id = %(id)s;
+"""
+
+
+class EmbeddingRow(NamedTuple):
+    id: str
+    embedding: np.ndarray
+    document: str
+    cmetadata: dict
+
+
+class BulkEmbeddingWriter:
+    """Embeds documents and streams them into langchain_pg_embedding with binary COPY.
+
+    Rows keep the exact shape langchain_postgres writes (id, collection_id,
+    embedding, document, cmetadata), so the bot's retrieval is unaffected.
+    Embedding happens outside any transaction; replace_pages() then swaps a
+    whole batch of pages' rows in one transaction.
+    Args:
+        db (Database): Loader connection pool.
+        embeddings (Embeddings): Model used to embed documents.
+        collection_name (str): Collection the rows belong to (must already exist).
+    """
+
+    def __init__(self,
+                 db: Database,
+                 embeddings: Embeddings,
+                 collection_name: str,
+                 ) -> None:
+        self.db = db
+        self.embeddings = embeddings
+        self.collection_name = collection_name
+        self.collection_id: Optional[Any] = None
+        self.rows_written = 0
+        self.write_seconds = 0.0
+
+    def row_id(self, doc: Document) -> str:
+        """Row id for a document: derived from its id within this collection, so
+        the same page gets distinct rows in the live and a shadow collection
+        (langchain_pg_embedding.id is unique across collections), or random."""
+        if not doc.id:
+            return str(uuid.uuid4())
+        return str(uuid.uuid5(uuid.UUID(str(self.get_collection_id())), doc.id))
+
+    def get_collection_id(self, conn: Optional[Connection] = None) -> Any:
+        if self.collection_id is None:
+            self.collection_id = self.db.fetchone(COLLECTION_ID_QUERY, {"collection_name": self.collection_name}, conn=conn).uuid
+        return self.collection_id
+
+    def embed(self, docs: List[Document]) -> List[EmbeddingRow]:
+        if not docs:
+            return []
+        vectors = self.embeddings.embed_documents([doc.page_content for doc in docs])
+        return [
+            EmbeddingRow(
+                id=self.row_id(doc),
+                embedding=np.asarray(vector, dtype=np.float32),
+                document=doc.page_content,
+                cmetadata=doc.metadata,
+            )
+            for doc, vector in zip(docs, vectors)
+        ]
+
+    def write(self, rows: List[EmbeddingRow], conn: Connection) -> int:
+        if not rows:
+            return 0
+        start = time.perf_counter()
+        collection_id = self.get_collection_id(conn)
+        register_vector(conn)
+
+        conn.execute(CREATE_STAGING_TABLE)
+        with conn.cursor() as cur:
+            with cur.copy(COPY_STAGING_ROWS) as copy:
+                copy.set_types(["varchar", "uuid", "vector", "varchar", "jsonb"])
+                for row in rows:
+                    copy.write_row((row.id, collection_id, row.embedding, row.document, Jsonb(row.cmetadata)))
+            cur.execute(UPSERT_STAGED_ROWS)
+        conn.execute("DROP TABLE loremaster_embedding_staging")
+
+        elapsed = time.perf_counter() - start
+        self.rows_written += len(rows)
+        self.write_seconds += elapsed
+        print(f"Wrote {len(rows)} rows in {elapsed:.2f}s ({len(rows) / elapsed if elapsed else 0:.0f} rows/s)")
+        return len(rows)
+
+    def replace_pages(self,
+                      page_ids: List[str],
+                      new_rows: List[EmbeddingRow],
+                      kept: Sequence[Tuple[str, Document]] = (),
+                      conn: Optional[Connection] = None,
+                      ) -> int:
+        """Make new_rows (plus any kept rows) the complete set of rows for these pages, atomically.
+
+        In one transaction every other row of the pages is deleted (chunks and
+        document rows alike), kept rows get their new metadata and the new rows
+        are upserted, so readers see either the old or the new pages and a
+        re-run of the same sync converges on the same rows. Pass conn to make
+        it part of a larger transaction. Returns the number of rows deleted.
+        """
+        with self.db.transaction(conn) as conn:
+            deleted = self.db.execute(
+                DELETE_PAGE_ROWS_QUERY,
+                {
+                    "collection_name": self.collection_name,
+                    "page_ids": page_ids,
+                    "keep_ids": [row_id for row_id, _ in kept],
+                },
+                conn=conn,
+            )
+            for row_id, doc in kept:
+                self.db.execute(UPDATE_METADATA_QUERY, {"id": row_id, "cmetadata": Jsonb(doc.metadata)}, conn=conn)
+            self.write(new_rows, conn)
+        return deleted
+
+    def stats(self) -> dict:
+        return {
+            "rows": self.rows_written,
+            "seconds": round(self.write_seconds, 2),
+            "rows_per_second": round(self.rows_written / self.write_seconds) if self.write_seconds else 0,
+        }
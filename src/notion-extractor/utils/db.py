@@ -0,0 +1,128 @@
+"""
+Pooled Postgres access for the loader's direct SQL paths
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from psycopg import Connection
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import namedtuple_row
+from psycopg_pool import ConnectionPool
+
+
+class PoolStats:
+    """Running totals for connection acquire wait and query execution time."""
+
+    def __init__(self) -> None:
+        self.acquires = 0
+        self.acquire_wait_total = 0.0
+        self.acquire_wait_max = 0.0
+        self.queries = 0
+        self.query_time_total = 0.0
+        self.query_time_max = 0.0
+
+    def record_acquire(self, seconds: float) -> None:
+        self.acquires += 1
+        self.acquire_wait_total += seconds
+        self.acquire_wait_max = max(self.acquire_wait_max, seconds)
+
+    def record_query(self, seconds: float) -> None:
+        self.queries += 1
+        self.query_time_total += seconds
+        self.query_time_max = max(self.query_time_max, seconds)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "acquires": self.acquires,
+            "acquire_wait_avg_ms": 1000 * self.acquire_wait_total / self.acquires if self.acquires else 0.0,
+            "acquire_wait_max_ms": 1000 * self.acquire_wait_max,
+            "queries": self.queries,
+            "query_time_avg_ms": 1000 * self.query_time_total / self.queries if self.queries else 0.0,
+            "query_time_max_ms": 1000 * self.query_time_max,
+        }
+
+
+class Database:
+    """Synchronous connection pool shared by the loader's SQL helpers.
+    Args:
+        db_config (dict): psycopg connection kwargs (host, port, dbname, user, password).
+        min_size (int): Minimum number of pooled connections.
+        max_size (int): Maximum number of pooled connections.
+    """
+
+    def __init__(self,
+                 db_config: Dict[str, Any],
+                 min_size: int = 1,
+                 max_size: int = 4,
+                 ) -> None:
+        self.db_config = db_config
+        self.pool = ConnectionPool(
+            make_conninfo(**db_config),
+            min_size=min_size,
+            max_size=max_size,
+            kwargs={"autocommit": True},
+            open=True,
+        )
+        self.pool_stats = PoolStats()
+
+    def close(self) -> None:
+        self.pool.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[Connection]:
+        start = time.perf_counter()
+        with self.pool.connection() as conn:
+            self.pool_stats.record_acquire(time.perf_counter() - start)
+            yield conn
+
+    @contextmanager
+    def transaction(self, conn: Optional[Connection] = None) -> Iterator[Connection]:
+        """Check out a connection and run everything inside one transaction, or
+        join a caller's transaction (as a savepoint) when conn is given."""
+        with self._use(conn) as c:
+            with c.transaction():
+                yield c
+
+    def execute(self, query: str, params: Optional[Dict[str, Any]] = None, conn: Optional[Connection] = None, prepare: bool = True) -> int:
+        """Run a statement and return the number of affected rows.
+        Pass prepare=False for DDL and other one-off utility statements."""
+        with self._use(conn) as c:
+            start = time.perf_counter()
+            with c.cursor() as cur:
+                cur.execute(query, params, prepare=prepare)
+                rowcount = cur.rowcount
+            self.pool_stats.record_query(time.perf_counter() - start)
+        return rowcount
+
+    def fetchall(self, query: str, params: Optional[Dict[str, Any]] = None, conn: Optional[Connection] = None, row_factory=namedtuple_row) -> List[Any]:
+        with self._use(conn) as c:
+            start = time.perf_counter()
+            with c.cursor(row_factory=row_factory) as cur:
+                cur.execute(query, params, prepare=True)
+                rows = cur.fetchall()
+            self.pool_stats.record_query(time.perf_counter() - start)
+        return rows
+
+    def fetchone(self, query: str, params: Optional[Dict[str, Any]] = None, conn: Optional[Connection] = None, row_factory=namedtuple_row) -> Any:
+        with self._use(conn) as c:
+            start = time.perf_counter()
+            with c.cursor(row_factory=row_factory) as cur:
+                cur.execute(query, params, prepare=True)
+                row = cur.fetchone()
+            self.pool_stats.record_query(time.perf_counter() - start)
+        return row
+
+    @contextmanager
+    def _use(self, conn: Optional[Connection]) -> Iterator[Connection]:
+        """Reuse a caller's connection (e.g. inside a transaction) or borrow one from the pool."""
+        if conn is not None:
+            yield conn
+        else:
+            with self.connection() as c:
+                yield c
+
+    def stats(self) -> Dict[str, Any]:
+        """Return our acquire/query timings merged with psycopg_pool's own counters."""
+        return {**self.pool.get_stats(), **self.pool_stats.as_dict()}
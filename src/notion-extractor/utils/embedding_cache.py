@@ -0,0 +1,135 @@
+"""
+Persistent embedding cache keyed by model name and normalized text hash
+"""
+
+import hashlib
+import os
+import time
+import unicodedata
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from .sqlite_cache import SqliteLruCache
+
+EMBEDDING_CACHE_DDL = """
+    CREATE TABLE IF NOT EXISTS embeddings (
+        key TEXT PRIMARY KEY,
+        vector BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        accessed_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_embeddings_accessed_at ON embeddings (accessed_at);
+"""
+
+# SQLite caps the number of bound parameters per statement
+LOOKUP_BATCH_SIZE = 500
+
+
+def embedding_cache_key(model_name: str, text: str) -> str:
+    """Cache key for a text: model name plus a hash of the NFC-normalized, stripped text."""
+    normalized = unicodedata.normalize("NFC", text).strip()
+    return f"{model_name}:{hashlib.sha256(normalized.encode()).hexdigest()}"
+
+
+class EmbeddingCache(SqliteLruCache):
+    """SQLite store of float32 embedding vectors.
+
+    Shared between the loader and the bot. Once the stored vectors grow past
+    max_bytes, the least recently used ones are evicted down to 90% of the limit.
+    Args:
+        path (str): Path of the SQLite file.
+        max_bytes (int): Size bound on the stored vectors.
+    """
+
+    TABLE = "embeddings"
+    DDL = EMBEDDING_CACHE_DDL
+
+    def __init__(self,
+                 path: str,
+                 max_bytes: int = 512 * 1024 * 1024,
+                 ) -> None:
+        super().__init__(path, max_bytes)
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self.lock:
+            for start in range(0, len(keys), LOOKUP_BATCH_SIZE):
+                batch = keys[start:start + LOOKUP_BATCH_SIZE]
+                placeholders = ", ".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                found.update((key, np.frombuffer(vector, dtype=np.float32).tolist()) for key, vector in rows)
+            now = time.time()
+            self.conn.executemany("UPDATE embeddings SET accessed_at = ? WHERE key = ?", [(now, key) for key in found])
+            self.conn.commit()
+            self.cache_stats["hits"] += len(found)
+            self.cache_stats["misses"] += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        now = time.time()
+        rows = []
+        for key, vector in items.items():
+            blob = np.asarray(vector, dtype=np.float32).tobytes()
+            rows.append((key, blob, len(blob), now))
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            self._record_writes(len(rows), sum(row[2] for row in rows))
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that serves previously embedded texts from an EmbeddingCache
+    and only sends the misses to the wrapped model, in a single batch.
+    Args:
+        embeddings (Embeddings): The model to embed cache misses with.
+        model_name (str): Namespace for the cache keys, so switching models never serves stale vectors.
+        cache (EmbeddingCache): The backing store.
+    """
+
+    def __init__(self,
+                 embeddings: Embeddings,
+                 model_name: str,
+                 cache: EmbeddingCache,
+                 ) -> None:
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache = cache
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [embedding_cache_key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        # Models may encode queries differently from documents, so they get their own keys
+        key = embedding_cache_key(f"{self.model_name}:query", text)
+        found = self.cache.get_many([key])
+        if key in found:
+            return found[key]
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many({key: vector})
+        return vector
+
+
+def cached_embeddings(embeddings: Embeddings, model_name: Optional[str] = None) -> Embeddings:
+    """Wrap a model in the embedding cache configured by EMBEDDING_CACHE_PATH /
+    EMBEDDING_CACHE_MAX_BYTES, or return it unchanged if EMBEDDING_CACHE_PATH is empty."""
+    path = os.getenv("EMBEDDING_CACHE_PATH", ".cache/embeddings.sqlite")
+    if not path:
+        return embeddings
+    cache = EmbeddingCache(path, max_bytes=int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", 512 * 1024 * 1024)))
+    return CachedEmbeddings(embeddings, model_name or getattr(embeddings, "model_name", type(embeddings).__name__), cache)
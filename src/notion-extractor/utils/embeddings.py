@@ -0,0 +1,66 @@
+"""
+Batched, optionally multi-process embedding stage for ingest
+"""
+
+import time
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from sentence_transformers import SentenceTransformer
+
+# Same default model as HuggingFaceEmbeddings, which the bot embeds queries with
+DEFAULT_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+
+
+class BatchedEmbeddings(Embeddings):
+    """Sentence-transformers embeddings tuned for bulk ingest.
+
+    Texts are sorted by length before batching so each batch pads to similar
+    lengths, and with workers > 1 the batches are spread over a multi-process
+    pool (one process per core). Vectors match HuggingFaceEmbeddings for the
+    same model, so they stay comparable with the bot's query embeddings.
+    Args:
+        model_name (str): Sentence-transformers model to load.
+        batch_size (int): Texts per forward pass.
+        workers (int): Encoding processes; 1 encodes in-process.
+    """
+
+    def __init__(self,
+                 model_name: str = DEFAULT_MODEL_NAME,
+                 batch_size: int = 32,
+                 workers: int = 1,
+                 ) -> None:
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.workers = workers
+        self.model = SentenceTransformer(model_name)
+        self.pool = self.model.start_multi_process_pool(target_devices=["cpu"] * workers) if workers > 1 else None
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        # HuggingFaceEmbeddings flattens newlines before encoding; do the same
+        texts = [text.replace("\n", " ") for text in texts]
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        sorted_texts = [texts[i] for i in order]
+
+        start = time.perf_counter()
+        if self.pool is not None:
+            vectors = self.model.encode_multi_process(sorted_texts, self.pool, batch_size=self.batch_size)
+        else:
+            vectors = self.model.encode(sorted_texts, batch_size=self.batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"Embedded {len(texts)} texts in {elapsed:.2f}s ({len(texts) / elapsed if elapsed else 0:.0f} texts/s, {self.workers} workers)")
+
+        embeddings = np.empty_like(vectors)
+        embeddings[order] = vectors
+        return embeddings.tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.encode(text.replace("\n", " ")).tolist()
+
+    def close(self):
+        if self.pool is not None:
+            self.model.stop_multi_process_pool(self.pool)
+            self.pool = None
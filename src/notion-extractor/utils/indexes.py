@@ -0,0 +1,393 @@
+"""
+Index management for langchain_pg_embedding: approximate nearest neighbour
+(HNSW / IVFFlat) indexes on the embedding column, and expression / partial
+indexes matching the JSONB metadata queries issued by the loader and the bot
+"""
+
+import json
+import math
+import statistics
+import time
+from typing import Any, Dict, List, Optional
+
+from psycopg import sql
+
+from .db import Database
+
+EMBEDDING_TABLE = "langchain_pg_embedding"
+ANN_INDEX_NAMES = {
+    "hnsw": "ix_langchain_pg_embedding_hnsw",
+    "ivfflat": "ix_langchain_pg_embedding_ivfflat",
+}
+# langchain_postgres defaults to cosine distance, so the indexes use the matching opclass
+VECTOR_OPCLASS = "vector_cosine_ops"
+
+EMBEDDING_COLUMN_TYPE_QUERY = """
+    SELECT format_type(attribute.atttypid, attribute.atttypmod) AS column_type
+    FROM pg_attribute attribute
+    WHERE attribute.attrelid = 'langchain_pg_embedding'::regclass
+    AND attribute.attname = 'embedding';
+"""
+
+EMBEDDING_DIMENSIONS_QUERY = """
+    SELECT DISTINCT vector_dims(embeddings.embedding) AS dims
+    FROM langchain_pg_embedding embeddings;
+"""
+
+INDEX_EXISTS_QUERY = """
+    SELECT indexdef
+    FROM pg_indexes
+    WHERE tablename = 'langchain_pg_embedding'
+    AND indexname = %(index_name)s;
+"""
+
+DEAD_TUPLES_QUERY = """
+    SELECT n_live_tup, n_dead_tup
+    FROM pg_stat_user_tables
+    WHERE relname = 'langchain_pg_embedding';
+"""
+
+COLLECTION_SIZE_QUERY = """
+    SELECT count(*) AS n
+    FROM langchain_pg_embedding embeddings
+    JOIN langchain_pg_collection collection
+        ON embeddings.collection_id = collection.uuid
+    WHERE collection.name = %(collection_name)s;
+"""
+
+SAMPLE_QUERY_VECTORS_QUERY = """
+    SELECT embeddings.embedding::text AS embedding
+    FROM langchain_pg_embedding embeddings
+    JOIN langchain_pg_collection collection
+        ON embeddings.collection_id = collection.uuid
+    WHERE collection.name = %(collection_name)s
+    ORDER BY random()
+    LIMIT %(n)s;
+"""
+
+# Mirrors the bot's lore retrieval query
+NEAREST_DOCUMENTS_QUERY = """
+    SELECT embeddings.id
+    FROM langchain_pg_embedding embeddings
+    JOIN langchain_pg_collection collection
+        ON embeddings.collection_id = collection.uuid
+    WHERE collection.name = %(collection_name)s
+    ORDER BY embeddings.embedding <=> %(embedding)s::vector
+    LIMIT %(k)s;
+"""
+
+
+# Expression / partial indexes for the metadata access paths:
+#  - existing documents per collection (determine_docs_to_load)
+#  - rows of a set of pages (plan_updated_docs)
+# Latest / previous session lookups are served by loremaster_session_timeline.
+METADATA_INDEXES = {
+    "ix_langchain_pg_embedding_type": """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_langchain_pg_embedding_type
+        ON langchain_pg_embedding (collection_id, (cmetadata->>'embedding_type'))
+    """,
+    "ix_langchain_pg_embedding_page_id": """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_langchain_pg_embedding_page_id
+        ON langchain_pg_embedding (collection_id, (cmetadata->>'id'), (cmetadata->>'embedding_type'))
+    """,
+}
+
+# Superseded by the session timeline table
+RETIRED_INDEXES = ["ix_langchain_pg_embedding_session_number"]
+
+# langchain_postgres normally creates ix_cmetadata_gin itself; only add ours if
+# no GIN index on cmetadata exists, so containment (@>) filters stay indexed.
+METADATA_GIN_INDEX = """
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_langchain_pg_embedding_cmetadata_gin
+    ON langchain_pg_embedding USING gin (cmetadata jsonb_path_ops)
+"""
+
+METADATA_GIN_EXISTS_QUERY = """
+    SELECT indexname
+    FROM pg_indexes
+    WHERE tablename = 'langchain_pg_embedding'
+    AND indexdef ILIKE '%USING gin (cmetadata%';
+"""
+
+# Mirrors the bot's /last-session timeline query for the EXPLAIN check
+SESSION_TIMELINE_QUERY = """
+    SELECT timeline.session_number, embeddings.document
+    FROM loremaster_session_timeline timeline
+    JOIN langchain_pg_embedding embeddings
+        ON embeddings.id = timeline.document_id
+    WHERE timeline.collection_name = %(collection_name)s
+    ORDER BY timeline.session_number DESC, timeline.created_time DESC
+    LIMIT %(limit)s;
+"""
+
+
+def ensure_metadata_indexes(db: Database):
+    """Create the JSONB expression / partial indexes (and GIN index) if missing."""
+    if db.fetchone("SELECT to_regclass('langchain_pg_embedding') AS name").name is None:
+        print("langchain_pg_embedding doesn't exist yet, skipping metadata indexes")
+        return
+    start = time.perf_counter()
+    for ddl in METADATA_INDEXES.values():
+        db.execute(ddl, prepare=False)
+    if db.fetchone(METADATA_GIN_EXISTS_QUERY) is None:
+        db.execute(METADATA_GIN_INDEX, prepare=False)
+    for index_name in RETIRED_INDEXES:
+        db.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(index_name)), prepare=False)
+    print(f"Metadata indexes in place ({time.perf_counter() - start:.2f}s)")
+
+
+def _plan_index_names(plan: Dict[str, Any]) -> List[str]:
+    names = [plan["Index Name"]] if "Index Name" in plan else []
+    for child in plan.get("Plans", []):
+        names.extend(_plan_index_names(child))
+    return names
+
+
+def check_index_usage(
+    db: Database,
+    checks: Dict[str, tuple[str, Dict[str, Any], str]],
+) -> bool:
+    """EXPLAIN each hot query and verify its plan can use the expected index.
+
+    Sequential scans are disabled for the check: on a small collection the
+    planner rightly prefers them, but we want to know that the index *matches*
+    the query's access path so it is picked up as the collection grows.
+
+    Args:
+        checks: query name -> (query, params, expected index name).
+    Returns:
+        True if every query's plan uses its expected index.
+    """
+    all_ok = True
+    for name, (query, params, expected_index) in checks.items():
+        with db.transaction() as conn:
+            conn.execute("SET LOCAL enable_seqscan = off")
+            plan = conn.execute(f"EXPLAIN (FORMAT JSON) {query}", params).fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        used = _plan_index_names(plan[0]["Plan"])
+        ok = expected_index in used
+        all_ok = all_ok and ok
+        print(f"  {'OK  ' if ok else 'MISS'} {name}: expected {expected_index}, plan uses {used or 'no index'}")
+    return all_ok
+
+
+def default_ivfflat_lists(n_rows: int) -> int:
+    """pgvector's recommendation: rows / 1000 up to 1M rows, sqrt(rows) beyond that."""
+    if n_rows > 1_000_000:
+        return int(math.sqrt(n_rows))
+    return max(10, n_rows // 1000)
+
+
+def ensure_fixed_dimensions(db: Database):
+    """ANN indexes need a typed vector(n) column; langchain_postgres creates an untyped one."""
+    column_type = db.fetchone(EMBEDDING_COLUMN_TYPE_QUERY).column_type
+    if column_type != "vector":
+        return
+
+    dims = [row.dims for row in db.fetchall(EMBEDDING_DIMENSIONS_QUERY)]
+    if len(dims) != 1:
+        raise ValueError(
+            f"Cannot index {EMBEDDING_TABLE}.embedding: expected a single embedding dimension, found {dims}"
+        )
+    print(f"Fixing {EMBEDDING_TABLE}.embedding column type to vector({dims[0]})")
+    db.execute(
+        sql.SQL("ALTER TABLE {} ALTER COLUMN embedding TYPE vector({})").format(
+            sql.Identifier(EMBEDDING_TABLE), sql.Literal(dims[0])
+        ),
+        prepare=False,
+    )
+
+
+def create_ann_index(
+    db: Database,
+    collection_name: str,
+    method: str = "hnsw",
+    rebuild: bool = False,
+    hnsw_m: int = 16,
+    hnsw_ef_construction: int = 64,
+    ivfflat_lists: Optional[int] = None,
+    maintenance_work_mem: Optional[str] = None,
+):
+    """Create (or rebuild with new parameters) the HNSW or IVFFlat index on the embedding column.
+
+    Rebuilds build the replacement index concurrently under a temporary name and
+    swap it in, so similarity searches keep using the old index until the new one
+    is ready. Any index of the other method is dropped, since only one is needed.
+    """
+    if method not in ANN_INDEX_NAMES:
+        raise ValueError(f"Unknown ANN index method: {method}")
+
+    index_name = ANN_INDEX_NAMES[method]
+    exists = db.fetchone(INDEX_EXISTS_QUERY, {"index_name": index_name}) is not None
+    if exists and not rebuild:
+        print(f"ANN index {index_name} already exists, use --rebuild-index to rebuild it")
+    else:
+        ensure_fixed_dimensions(db)
+
+        if method == "hnsw":
+            params = {"m": hnsw_m, "ef_construction": hnsw_ef_construction}
+        else:
+            if ivfflat_lists is None:
+                n_rows = db.fetchone(COLLECTION_SIZE_QUERY, {"collection_name": collection_name}).n
+                ivfflat_lists = default_ivfflat_lists(n_rows)
+            params = {"lists": ivfflat_lists}
+
+        build_name = f"{index_name}_new" if exists else index_name
+        with_clause = sql.SQL(", ").join(
+            sql.SQL("{} = {}").format(sql.SQL(key), sql.Literal(value)) for key, value in params.items()
+        )
+
+        print(f"Building ANN index {index_name} using {method} with {params}")
+        start = time.perf_counter()
+        with db.connection() as conn:
+            if maintenance_work_mem:
+                conn.execute(sql.SQL("SET maintenance_work_mem = {}").format(sql.Literal(maintenance_work_mem)))
+            conn.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(build_name)))
+            conn.execute(
+                sql.SQL("CREATE INDEX CONCURRENTLY {} ON {} USING {} (embedding {}) WITH ({})").format(
+                    sql.Identifier(build_name),
+                    sql.Identifier(EMBEDDING_TABLE),
+                    sql.SQL(method),
+                    sql.SQL(VECTOR_OPCLASS),
+                    with_clause,
+                )
+            )
+            if maintenance_work_mem:
+                conn.execute("RESET maintenance_work_mem")
+        if exists:
+            with db.transaction() as conn:
+                conn.execute(sql.SQL("DROP INDEX {}").format(sql.Identifier(index_name)))
+                conn.execute(
+                    sql.SQL("ALTER INDEX {} RENAME TO {}").format(sql.Identifier(build_name), sql.Identifier(index_name))
+                )
+        print(f"Built ANN index {index_name} in {time.perf_counter() - start:.1f}s")
+
+    for other_method, other_name in ANN_INDEX_NAMES.items():
+        if other_method != method:
+            db.execute(sql.SQL("DROP INDEX CONCURRENTLY IF EXISTS {}").format(sql.Identifier(other_name)), prepare=False)
+
+
+def _nearest_documents(
+    db: Database,
+    collection_name: str,
+    embedding: str,
+    k: int,
+    exact: bool,
+    ef_search: Optional[int],
+    probes: Optional[int],
+) -> tuple[List[str], float]:
+    with db.transaction() as conn:
+        if exact:
+            # Force a sequential scan to get the true nearest neighbours
+            conn.execute("SET LOCAL enable_indexscan = off")
+            conn.execute("SET LOCAL enable_bitmapscan = off")
+        else:
+            if ef_search:
+                conn.execute("SELECT set_config('hnsw.ef_search', %s, true)", (str(ef_search),))
+            if probes:
+                conn.execute("SELECT set_config('ivfflat.probes', %s, true)", (str(probes),))
+        start = time.perf_counter()
+        rows = db.fetchall(
+            NEAREST_DOCUMENTS_QUERY,
+            {"collection_name": collection_name, "embedding": embedding, "k": k},
+            conn=conn,
+        )
+        elapsed = time.perf_counter() - start
+    return [row.id for row in rows], elapsed
+
+
+def ann_index_report(
+    db: Database,
+    collection_name: str,
+    n_queries: int = 50,
+    k: int = 5,
+    ef_search: Optional[int] = None,
+    probes: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Compare exact (sequential scan) and ANN (index) searches on a sample of stored vectors.
+
+    Reports median / p95 latency for both and the ANN's recall@k against the
+    exact results, using the same collection-filtered query as the bot. The
+    ANN index covers the whole table, so the collection filter is applied
+    after the index scan: while a shadow collection exists its rows compete
+    for the ef_search / probes candidates and recall can drop.
+    """
+    queries = [row.embedding for row in db.fetchall(
+        SAMPLE_QUERY_VECTORS_QUERY, {"collection_name": collection_name, "n": n_queries}
+    )]
+    if not queries:
+        print(f"No embeddings in collection '{collection_name}' to benchmark")
+        return {}
+
+    exact_latencies, ann_latencies, recalls = [], [], []
+    for embedding in queries:
+        exact_ids, exact_latency = _nearest_documents(db, collection_name, embedding, k, True, None, None)
+        ann_ids, ann_latency = _nearest_documents(db, collection_name, embedding, k, False, ef_search, probes)
+        exact_latencies.append(exact_latency)
+        ann_latencies.append(ann_latency)
+        if exact_ids:
+            recalls.append(len(set(exact_ids) & set(ann_ids)) / len(exact_ids))
+
+    def summarise(latencies: List[float]) -> Dict[str, float]:
+        ordered = sorted(latencies)
+        return {
+            "p50_ms": 1000 * statistics.median(ordered),
+            "p95_ms": 1000 * ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+        }
+
+    report = {
+        "queries": len(queries),
+        "k": k,
+        "exact": summarise(exact_latencies),
+        "ann": summarise(ann_latencies),
+        "recall_at_k": statistics.mean(recalls) if recalls else None,
+    }
+
+    print(f"\nANN index report for collection '{collection_name}' ({len(queries)} queries, k={k})")
+    print(f"  before (exact scan): p50 {report['exact']['p50_ms']:.1f}ms  p95 {report['exact']['p95_ms']:.1f}ms  recall 1.000")
+    recall = f"{report['recall_at_k']:.3f}" if recalls else "n/a"
+    print(f"  after  (ANN index):  p50 {report['ann']['p50_ms']:.1f}ms  p95 {report['ann']['p95_ms']:.1f}ms  recall {recall}")
+    return report
+
+
+def vacuum_if_bloated(
+    db: Database,
+    vacuum_ratio: float = 0.2,
+    reindex_ratio: Optional[float] = None,
+):
+    """VACUUM ANALYZE the embedding table once dead tuples make up vacuum_ratio of it.
+
+    If dead tuples still make up reindex_ratio of it afterwards (the VACUUM was
+    disabled, or couldn't reclaim them past an open transaction), the ANN index
+    is also rebuilt with REINDEX CONCURRENTLY, since graph/list indexes keep
+    the space and search cost of deleted vectors. A ratio of 0 or less
+    disables that step.
+    """
+    dead_ratio = _dead_tuple_ratio(db)
+    if dead_ratio is None:
+        return
+
+    if vacuum_ratio > 0 and dead_ratio >= vacuum_ratio:
+        start = time.perf_counter()
+        db.execute(sql.SQL("VACUUM (ANALYZE) {}").format(sql.Identifier(EMBEDDING_TABLE)), prepare=False)
+        print(f"Vacuumed {EMBEDDING_TABLE} in {time.perf_counter() - start:.1f}s")
+        # VACUUM cleans the ANN index's entries too, so only what it left behind counts
+        dead_ratio = _dead_tuple_ratio(db) or 0.0
+
+    if reindex_ratio and reindex_ratio > 0 and dead_ratio >= reindex_ratio:
+        for index_name in ANN_INDEX_NAMES.values():
+            if db.fetchone(INDEX_EXISTS_QUERY, {"index_name": index_name}) is None:
+                continue
+            start = time.perf_counter()
+            db.execute(sql.SQL("REINDEX INDEX CONCURRENTLY {}").format(sql.Identifier(index_name)), prepare=False)
+            print(f"Reindexed {index_name} in {time.perf_counter() - start:.1f}s")
+
+
+def _dead_tuple_ratio(db: Database) -> Optional[float]:
+    row = db.fetchone(DEAD_TUPLES_QUERY)
+    if row is None or not (row.n_live_tup + row.n_dead_tup):
+        return None
+    dead_ratio = row.n_dead_tup / (row.n_live_tup + row.n_dead_tup)
+    print(f"{EMBEDDING_TABLE}: {row.n_dead_tup} dead / {row.n_live_tup} live tuples ({dead_ratio:.1%} dead)")
+    return dead_ratio
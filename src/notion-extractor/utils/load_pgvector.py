@@ -4,22 +4,45 @@ Adapted from https://github.com/johntday/notion-load/blob/main/notion_load/qdran
 
 import os
 import re
+from collections import defaultdict
 from datetime import datetime
 
-from langchain_huggingface import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
 #from langchain_community.vectorstores.pgvector import PGVector
 from langchain_postgres import PGVector
 from langchain_postgres.vectorstores import PGVector
 
-import psycopg
-from psycopg.rows import namedtuple_row
-
-from typing import List
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
 from langchain.docstore.document import Document
 
-from .MyNotionDBLoader import MyNotionDBLoader
-
-from .load_util import split_documents
+from .MyNotionDBLoader import MyNotionDBLoader, needs_reload
+from .block_cache import BlockCache, purge_block_cache
+from .bulk_writer import BulkEmbeddingWriter
+from .db import Database
+from .embedding_cache import CachedEmbeddings, cached_embeddings
+from .embeddings import BatchedEmbeddings
+from .indexes import (
+    SESSION_TIMELINE_QUERY,
+    ann_index_report,
+    check_index_usage,
+    create_ann_index,
+    ensure_metadata_indexes,
+    vacuum_if_bloated,
+)
+from .pdf_cache import PdfTextCache, purge_pdf_cache
+from .schema import (
+    bump_collection_version,
+    ensure_schema,
+    garbage_collect_collections,
+    invalidate_session_narrative,
+    resolve_collection,
+    shadow_collection_name,
+    swap_and_collect,
+    sync_session_timeline,
+)
+from .sync_daemon import AdaptivePoller, run_daemon, stop_on_signals
+
+from .load_util import add_content_hashes, add_token_counts, batched, content_hash, split_documents
 
 
 def load_pgvector(args):
@@ -33,6 +56,8 @@ def load_pgvector(args):
     POSTGRES_DBNAME = os.getenv("POSTGRES_DBNAME")
     POSTGRES_HOST = os.getenv("POSTGRES_HOST")
     POSTGRES_PORT = os.getenv("POSTGRES_PORT")
+    DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 1))
+    DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 4))
 
     db_config = {
         "host": POSTGRES_HOST,
@@ -42,99 +67,333 @@ def load_pgvector(args):
         "password": POSTGRES_PASSWORD,
     }
 
-    notion_loader = MyNotionDBLoader(
-        SECRET__NOTION_TOKEN,
-        NOTION_DATABASE_ID,
-        args.verbose,
-        validate_missing_content=True,
-        validate_missing_metadata=["id"],
-        metadata_filter_list=["id", "name", "tags", "created time", "last modified"],
-    )
-    original_docs = notion_loader.load()
-    print(f"\nFetched {len(original_docs)} documents from Notion")
+    LOAD_BATCH_SIZE = int(os.getenv("LOAD_BATCH_SIZE", 16))
+    COLLECTION_GC_GRACE = float(os.getenv("COLLECTION_GC_GRACE", 60))
+    VACUUM_DEAD_TUPLE_RATIO = float(os.getenv("VACUUM_DEAD_TUPLE_RATIO", 0.2))
+    REINDEX_DEAD_TUPLE_RATIO = float(os.getenv("REINDEX_DEAD_TUPLE_RATIO", 0.5))
+    NOTION_BLOCK_CACHE_PATH = os.getenv("NOTION_BLOCK_CACHE_PATH", ".cache/notion_blocks.sqlite")
+    NOTION_BLOCK_CACHE_MAX_BYTES = int(os.getenv("NOTION_BLOCK_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    PDF_CACHE_PATH = os.getenv("PDF_CACHE_PATH", ".cache/pdf_text.sqlite")
+    PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+    if args.purge_cache:
+        purge_block_cache(NOTION_BLOCK_CACHE_PATH)
+        purge_pdf_cache(PDF_CACHE_PATH)
+    block_cache = None
+    pdf_cache = None
+    if not args.no_cache and not args.index_only:
+        block_cache = BlockCache(NOTION_BLOCK_CACHE_PATH, max_bytes=NOTION_BLOCK_CACHE_MAX_BYTES)
+        pdf_cache = PdfTextCache(PDF_CACHE_PATH, max_bytes=PDF_CACHE_MAX_BYTES)
+
+    db = Database(db_config, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE)
+    notion_loader = None
+    embeddings_model = None
+    try:
+        ensure_schema(db)
+        if not args.index_only:
+            notion_loader = MyNotionDBLoader(
+                SECRET__NOTION_TOKEN,
+                NOTION_DATABASE_ID,
+                args.verbose,
+                validate_missing_content=True,
+                validate_missing_metadata=["id"],
+                metadata_filter_list=["id", "name", "tags", "created time", "last modified"],
+                requests_per_second=float(os.getenv("NOTION_REQUESTS_PER_SECOND", 3.0)),
+                max_workers=int(os.getenv("NOTION_MAX_WORKERS", 4)),
+                block_cache=block_cache,
+                max_pending_pages=int(os.getenv("NOTION_PREFETCH_PAGES", 2 * LOAD_BATCH_SIZE)),
+                pdf_cache=pdf_cache,
+                pdf_workers=int(os.getenv("PDF_PARSE_WORKERS", os.cpu_count() or 1)),
+            )
+            embeddings_model = make_embeddings_model(args)
+            sync = lambda rebuild: sync_collection(
+                db=db,
+                notion_loader=notion_loader,
+                embeddings_model=embeddings_model,
+                alias=COLLECTION_NAME,
+                db_config=db_config,
+                rebuild=rebuild,
+                batch_size=LOAD_BATCH_SIZE,
+                gc_grace_seconds=COLLECTION_GC_GRACE,
+                vacuum_ratio=VACUUM_DEAD_TUPLE_RATIO,
+                reindex_ratio=REINDEX_DEAD_TUPLE_RATIO,
+            )
+            # Read before the first sync, so edits made while it runs are picked up by the daemon
+            watermark = notion_loader.latest_edit_time() if args.daemon else None
+            sync(not args.incremental or args.reset)
+
+        live_collection = resolve_collection(db, COLLECTION_NAME)
+        ensure_metadata_indexes(db)
+        manage_ann_index(args, db, live_collection)
+        if args.check_indexes:
+            check_metadata_index_usage(db, live_collection)
+
+        if args.daemon and not args.index_only:
+            # The loader, embedding model and DB pool stay warm between syncs,
+            # and every sync after the first is incremental
+            run_daemon(
+                latest_edit=notion_loader.latest_edit_time,
+                sync=lambda: sync(False),
+                poller=AdaptivePoller(
+                    min_interval=float(os.getenv("SYNC_POLL_MIN_INTERVAL", 15)),
+                    max_interval=float(os.getenv("SYNC_POLL_MAX_INTERVAL", 600)),
+                ),
+                resync_interval=float(os.getenv("SYNC_RESYNC_INTERVAL", 3600)),
+                stop=stop_on_signals(),
+                watermark=watermark,
+            )
+    finally:
+        print(f"DB pool stats: {db.stats()}")
+        db.close()
+        if notion_loader is not None:
+            notion_loader.close()
+        if embeddings_model is not None:
+            close_embeddings_model(embeddings_model)
+        if block_cache is not None:
+            block_cache.close()
+        if pdf_cache is not None:
+            pdf_cache.close()
+
+def sync_collection(
+    db: Database,
+    notion_loader: MyNotionDBLoader,
+    embeddings_model: Embeddings,
+    alias: str,
+    db_config: dict,
+    rebuild: bool,
+    batch_size: int = 16,
+    gc_grace_seconds: float = 60,
+    vacuum_ratio: float = 0.2,
+    reindex_ratio: Optional[float] = None,
+):
+    """Sync the Notion database into the collection behind `alias`.
+
+    The alias names the collection the bot reads. Incremental syncs update
+    that collection in place; rebuilds build a shadow collection and swap the
+    alias over to it. Either way the collection version is bumped when
+    anything changed, which is what consumers watch.
+    """
+    if rebuild:
+        garbage_collect_collections(db, alias, grace_seconds=gc_grace_seconds)
+        target_collection = shadow_collection_name(alias)
+    else:
+        target_collection = resolve_collection(db, alias)
+    print(f"Loading into collection '{target_collection}'")
 
-    if args.incremental:
-        load_incremental_docs(
+    page_filter = None
+    if not rebuild:
+        page_filter = lambda page_summaries: select_changed_pages(
+            page_summaries, target_collection, db, notion_loader.live_page_ids
+        )
+    # Pages stream out of the loader and are chunked, embedded and written
+    # in batches, so fetching keeps going while a batch is being embedded
+    original_docs = notion_loader.lazy_load(page_filter=page_filter)
+
+    if rebuild:
+        initialise_and_load_docs(
             original_docs=original_docs,
-            collection_name=COLLECTION_NAME,
+            collection_name=target_collection,
             db_config=db_config,
-            reset=args.reset,
+            db=db,
+            embeddings_model=embeddings_model,
+            batch_size=batch_size,
         )
+        swap_and_collect(db, alias, target_collection, grace_seconds=gc_grace_seconds)
     else:
-        initialise_and_load_docs(
-            original_docs=original_docs, 
-            collection_name=COLLECTION_NAME,
+        load_incremental_docs(
+            original_docs=original_docs,
+            collection_name=target_collection,
+            alias=alias,
             db_config=db_config,
+            db=db,
+            embeddings_model=embeddings_model,
+            batch_size=batch_size,
+        )
+        sweep_deleted_pages(
+            db=db,
+            collection_name=target_collection,
+            alias=alias,
+            live_page_ids=notion_loader.live_page_ids,
+        )
+        vacuum_if_bloated(db, vacuum_ratio=vacuum_ratio, reindex_ratio=reindex_ratio)
+
+def manage_ann_index(args, db: Database, collection_name: str):
+    if args.index_report and args.index:
+        print("\nBaseline before (re)building the ANN index:")
+        ann_index_report(db, collection_name, ef_search=args.ef_search, probes=args.probes)
+    if args.index:
+        create_ann_index(
+            db,
+            collection_name,
+            method=args.index,
+            rebuild=args.rebuild_index,
+            hnsw_m=args.hnsw_m,
+            hnsw_ef_construction=args.hnsw_ef_construction,
+            ivfflat_lists=args.ivfflat_lists,
         )
+    if args.index_report:
+        ann_index_report(db, collection_name, ef_search=args.ef_search, probes=args.probes)
+
+def check_metadata_index_usage(db: Database, collection_name: str) -> bool:
+    print("\nChecking that the hot metadata queries use their indexes:")
+    return check_index_usage(db, {
+        "determine_docs_to_load": (
+            EXISTING_DOCS_QUERY,
+            {"collection_name": collection_name},
+            "ix_langchain_pg_embedding_type",
+        ),
+        "plan_updated_docs": (
+            ROWS_FOR_PAGES_QUERY,
+            {"collection_name": collection_name, "page_ids": ["00000000-0000-0000-0000-000000000000"]},
+            "ix_langchain_pg_embedding_page_id",
+        ),
+        "last_session": (
+            SESSION_TIMELINE_QUERY,
+            {"collection_name": collection_name, "limit": 6},
+            "ix_loremaster_session_timeline_latest",
+        ),
+    })
 
 def load_incremental_docs(
-    original_docs: List[Document],
+    original_docs: Iterable[Document],
     collection_name: str,
+    alias: str,
     db_config: dict,
-    reset: bool,
+    db: Database,
+    embeddings_model: Embeddings,
+    batch_size: int = 16,
 ):
-    # Determine which are new or updated docs
-    new_docs, updated_docs = determine_docs_to_load(
-        original_docs,
-        collection_name,
-        db_config,
-    )
-
-    # Leverage Huggingface embeddings model
-    embeddings_model = HuggingFaceEmbeddings()
-
     connection_string = f"postgresql+psycopg://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['dbname']}"
     
-    # Initialise existing vector store
-    db = PGVector.from_existing_index(
+    # Not used for writing: constructing it creates the langchain_postgres
+    # tables and the collection on a fresh database
+    PGVector.from_existing_index(
         embedding=embeddings_model,
         collection_name=collection_name,
         connection=connection_string,
-        pre_delete_collection=reset,
     )
 
-    print(f"length of new_docs: {len(new_docs)}")
-    if new_docs:
-        chunked_new_docs = prepare_chunks(new_docs)
-        db.add_documents(documents=chunked_new_docs)
-        db.add_documents(documents=new_docs)
-
-    print(f"length of updated_docs: {len(updated_docs)}")
-    if updated_docs:
-        chunked_updated_docs = prepare_chunks(updated_docs)
-        delete_old_chunks(
-            docs=updated_docs,
-            db_config=db_config,
-            vector_db=db,
-            collection_name=collection_name,
+    writer = BulkEmbeddingWriter(db, embeddings_model, collection_name)
+
+    # Determine which are new or updated docs
+    existing_doc_modified_timestamps = existing_doc_timestamps(collection_name, db)
+
+    n_new_docs = 0
+    n_updated_docs = 0
+    n_skipped_embeddings = 0
+    n_deleted_rows = 0
+    session_notes_changed = False
+    for batch in batched(original_docs, batch_size):
+        new_docs, updated_docs = determine_docs_to_load(
+            batch,
+            collection_name,
+            db,
+            existing_doc_modified_timestamps,
         )
-        db.add_documents(documents=chunked_updated_docs)
-        db.add_documents(documents=updated_docs)
+
+        to_embed = []
+        if new_docs:
+            to_embed += prepare_chunks(new_docs) + new_docs
+
+        update_plan = None
+        if updated_docs:
+            chunked_updated_docs = prepare_chunks(updated_docs)
+            update_plan = plan_updated_docs(
+                docs=updated_docs,
+                chunked_docs=chunked_updated_docs,
+                db=db,
+                collection_name=collection_name,
+            )
+            to_embed += update_plan.to_embed
+            n_skipped_embeddings += len(update_plan.kept)
+
+        # Embed outside the transaction, then replace the batch's pages and
+        # bring the session timeline in line with them in one (a page may
+        # also have stopped being session notes)
+        rows = writer.embed(to_embed)
+        with db.transaction() as conn:
+            n_deleted_rows += writer.replace_pages(
+                page_ids=[doc.id for doc in new_docs + updated_docs],
+                new_rows=rows,
+                kept=update_plan.kept if update_plan is not None else [],
+                conn=conn,
+            )
+            sync_session_timeline(db, collection_name, conn=conn)
+
+        n_new_docs += len(new_docs)
+        n_updated_docs += len(updated_docs)
+        session_notes_changed = session_notes_changed or has_session_notes(new_docs + updated_docs)
+        print(f"Loaded batch of {len(batch)} docs: {len(new_docs)} new, {len(updated_docs)} updated")
+
+    print(f"length of new_docs: {n_new_docs}")
+    print(f"length of updated_docs: {n_updated_docs}")
+    print(f"embeddings skipped for unchanged content: {n_skipped_embeddings}")
+    print(f"stale rows deleted: {n_deleted_rows}")
+    print(f"Bulk writer stats: {writer.stats()}")
+    print_embedding_cache_stats(embeddings_model)
+
+    # Every batch synced the timeline with its writes; this backfills collections
+    # that predate the timeline even when nothing changed
+    sync_session_timeline(db, collection_name)
+    if n_new_docs or n_updated_docs:
+        bump_collection_version(db, alias)
+    if session_notes_changed:
+        invalidate_session_narrative(db, alias)
 
     
     
 def initialise_and_load_docs(
-    original_docs: List[Document], 
+    original_docs: Iterable[Document], 
     collection_name: str,
     db_config: dict,
+    db: Database,
+    embeddings_model: Embeddings,
+    batch_size: int = 16,
 ):
-    # Split documents into chunks
-    chunked_docs = prepare_chunks(original_docs)
-
-    # Leverage Huggingface embeddings model
-    embeddings_model = HuggingFaceEmbeddings()
-
     connection_string = f"postgresql+psycopg://{db_config['user']}:{db_config['password']}@{db_config['host']}:{db_config['port']}/{db_config['dbname']}"
     
-    db = PGVector.from_documents(
-        documents=chunked_docs,
-        embedding=embeddings_model,
+    # Not used for writing: constructing it creates the langchain_postgres
+    # tables and the collection if needed
+    PGVector(
+        embeddings=embeddings_model,
         collection_name=collection_name,
         connection=connection_string,
         use_jsonb=True,
     )
-    db.add_documents(original_docs)
+    writer = BulkEmbeddingWriter(db, embeddings_model, collection_name)
+
+    n_docs = 0
+    for batch in batched(original_docs, batch_size):
+        # Split documents into chunks
+        chunked_docs = prepare_chunks(batch)
+        rows = writer.embed(chunked_docs + batch)
+        writer.replace_pages(page_ids=[doc.id for doc in batch], new_rows=rows)
+        n_docs += len(batch)
+        print(f"Loaded batch of {len(batch)} docs ({len(chunked_docs)} chunks), {n_docs} so far")
+    print(f"Bulk writer stats: {writer.stats()}")
+    print_embedding_cache_stats(embeddings_model)
+
+    # The version bump and narrative invalidation happen with the alias swap
+    sync_session_timeline(db, collection_name)
     
+def make_embeddings_model(args) -> Embeddings:
+    """Ingest embeddings model (batched, optionally multi-process), behind the local embedding cache."""
+    return cached_embeddings(BatchedEmbeddings(
+        batch_size=args.embed_batch_size,
+        workers=args.embed_workers,
+    ))
+
+def print_embedding_cache_stats(embeddings_model: Embeddings):
+    if isinstance(embeddings_model, CachedEmbeddings):
+        print(f"Embedding cache stats: {embeddings_model.cache.stats()}")
+
+def close_embeddings_model(embeddings_model: Embeddings):
+    if isinstance(embeddings_model, CachedEmbeddings):
+        embeddings_model.cache.close()
+        embeddings_model = embeddings_model.embeddings
+    if isinstance(embeddings_model, BatchedEmbeddings):
+        embeddings_model.close()
+
 def prepare_chunks(
     docs: List[Document],
 ):
@@ -146,84 +405,187 @@ def prepare_chunks(
         doc.metadata["embedding_type"] = "document"
 
     # Extract session numbers from names of session notes docs
-    if any([True for doc in docs if "Session Notes" in doc.metadata["tags"]]):
+    if has_session_notes(docs):
         session_notes = [doc for doc in docs if "Session Notes" in doc.metadata["tags"]]
         for doc in session_notes:
             doc.metadata["session_number"] = int(re.findall(r"\d+", doc.metadata["name"])[0])
 
-        # Find doc with latest created date and set metadata flag against it
-        latest_session_notes = max(session_notes, key=lambda d: d.metadata["created time"])
-        latest_session_notes.metadata["is_latest"] = True
+        # Which session is the latest is tracked across the whole collection in
+        # the session timeline table (see sync_session_timeline), not per batch
+
+    # Token counts for the bot's context packer, and content hashes so
+    # unchanged chunks of an updated page can keep their embeddings
+    add_token_counts(docs)
+    add_token_counts(chunked_docs)
+    add_content_hashes(docs)
+    add_content_hashes(chunked_docs)
 
     return chunked_docs
     
 
 
+EXISTING_DOCS_QUERY = """
+    SELECT embeddings.cmetadata->>'id' AS page_id,
+            (embeddings.cmetadata->>'last modified')::TIMESTAMP AS last_modified_timestamp,
+            embeddings.cmetadata->>'fetched_at' AS fetched_at
+    FROM langchain_pg_embedding embeddings
+    JOIN langchain_pg_collection collection
+        ON embeddings.collection_id = collection.uuid
+    WHERE collection.name = %(collection_name)s
+    AND embeddings.cmetadata->>'embedding_type' = 'document';
+"""
+
+ROWS_FOR_PAGES_QUERY = """
+    SELECT embeddings.id,
+            embeddings.cmetadata->>'id' AS page_id,
+            embeddings.cmetadata->>'embedding_type' AS embedding_type,
+            embeddings.cmetadata->>'content_hash' AS content_hash,
+            embeddings.document
+    FROM langchain_pg_embedding embeddings
+    JOIN langchain_pg_collection collection
+        ON embeddings.collection_id = collection.uuid
+    WHERE collection.name = %(collection_name)s
+    AND embeddings.cmetadata->>'id' = ANY(%(page_ids)s);
+"""
+
+# Rows of every page that is no longer in the Notion database (or is archived)
+SWEEP_PAGES_QUERY = """
+    DELETE FROM langchain_pg_embedding embeddings
+    USING langchain_pg_collection collection
+    WHERE embeddings.collection_id = collection.uuid
+    AND collection.name = %(collection_name)s
+    AND embeddings.cmetadata->>'id' <> ALL(%(live_page_ids)s)
+    RETURNING embeddings.cmetadata->>'id' AS page_id,
+            embeddings.cmetadata ? 'session_number' AS is_session_notes;
+"""
+
+
+
+def has_session_notes(docs: List[Document]) -> bool:
+    return any("Session Notes" in doc.metadata["tags"] for doc in docs)
+
+
+def parse_notion_timestamp(value: str) -> datetime:
+    return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f%z").replace(tzinfo=None)
+
+class StoredPage(NamedTuple):
+    last_modified: datetime
+    fetched_at: Optional[datetime]
+
+def existing_doc_timestamps(
+    collection_name: str,
+    db: Database
+) -> Dict[str, StoredPage]:
+    existing_docs = db.fetchall(EXISTING_DOCS_QUERY, {"collection_name": collection_name})
+    return {
+        doc.page_id: StoredPage(
+            doc.last_modified_timestamp,
+            parse_notion_timestamp(doc.fetched_at) if doc.fetched_at else None,
+        )
+        for doc in existing_docs
+    }
+
+def is_changed(last_edited_time: str, stored: Optional[StoredPage]) -> bool:
+    """Whether a page is new, or edited since (or in the same minute as) its stored copy."""
+    return stored is None or needs_reload(parse_notion_timestamp(last_edited_time), *stored)
+
+def select_changed_pages(
+    page_summaries: List[Dict[str, Any]],
+    collection_name: str,
+    db: Database,
+    live_page_ids: Optional[Set[str]] = None,
+) -> List[Dict[str, Any]]:
+    """Keep only the pages that are new or were edited after the stored copy,
+    using last_edited_time from the database query so unchanged pages never
+    have their blocks fetched. Hidden (Archived / Indexed) pages are never
+    stored, so they are dropped here rather than looking new on every run."""
+    existing_doc_modified_timestamps = existing_doc_timestamps(collection_name, db)
+
+    return [
+        page_summary for page_summary in page_summaries
+        if (live_page_ids is None or page_summary["id"] in live_page_ids)
+        and is_changed(page_summary["last_edited_time"], existing_doc_modified_timestamps.get(page_summary["id"]))
+    ]
+
 def determine_docs_to_load(
     notion_docs: List[Document],
     collection_name: str, 
-    db_config: dict
+    db: Database,
+    existing_doc_modified_timestamps: Optional[Dict[str, StoredPage]] = None,
 ):
-    conn = psycopg.connect(**db_config)
-    cur = conn.cursor(row_factory=namedtuple_row)
-
-    cur.execute(
-        f"""
-        SELECT embeddings.cmetadata->>'id' AS page_id,
-                (embeddings.cmetadata->>'last modified')::TIMESTAMP AS last_modified_timestamp
-        FROM langchain_pg_embedding embeddings
-        JOIN langchain_pg_collection collection
-            ON embeddings.collection_id = collection.uuid
-        WHERE collection.name = '{collection_name}'
-        AND embeddings.cmetadata->>'embedding_type' = 'document';
-        """
-    )
-    existing_docs = cur.fetchall()
-
-    cur.close()
-    conn.close()
-
-    existing_doc_modified_timestamps = {
-        doc.page_id: doc.last_modified_timestamp for doc in existing_docs
-    }
+    if existing_doc_modified_timestamps is None:
+        existing_doc_modified_timestamps = existing_doc_timestamps(collection_name, db)
 
     new_docs = []
     updated_docs = []
     for doc in notion_docs:
         if doc.metadata["id"] not in existing_doc_modified_timestamps.keys():
             new_docs.append(doc)
-        elif datetime.strptime(doc.metadata["last modified"], "%Y-%m-%dT%H:%M:%S.%f%z").replace(tzinfo=None) > existing_doc_modified_timestamps[doc.metadata["id"]]:
+        elif is_changed(doc.metadata["last modified"], existing_doc_modified_timestamps[doc.metadata["id"]]):
             updated_docs.append(doc)
 
     return new_docs, updated_docs
 
-def delete_old_chunks(
+def sweep_deleted_pages(
+    db: Database,
+    collection_name: str,
+    alias: str,
+    live_page_ids: Optional[Set[str]],
+) -> int:
+    """Delete the rows of pages that were deleted or archived in Notion, in one statement.
+    Returns the number of rows reclaimed."""
+    if not live_page_ids:
+        # An empty listing is far more likely a bad query than an empty campaign
+        print("No live Notion pages found, skipping the deleted page sweep")
+        return 0
+
+    # The timeline and version change commit with the delete
+    with db.transaction() as conn:
+        rows = db.fetchall(SWEEP_PAGES_QUERY, {"collection_name": collection_name, "live_page_ids": list(live_page_ids)}, conn=conn)
+        print(f"Swept {len({row.page_id for row in rows})} deleted or archived pages, reclaimed {len(rows)} rows")
+        if rows:
+            if any(row.is_session_notes for row in rows):
+                sync_session_timeline(db, collection_name, conn=conn)
+                invalidate_session_narrative(db, alias, conn=conn)
+            bump_collection_version(db, alias, conn=conn)
+    return len(rows)
+
+class UpdatePlan(NamedTuple):
+    kept: List[Tuple[str, Document]]
+    to_embed: List[Document]
+
+def plan_updated_docs(
     docs: List[Document],
-    db_config: dict,
-    vector_db: PGVector, 
+    chunked_docs: List[Document],
+    db: Database,
     collection_name: str
-):
-
-    # Retrieve IDs of all chunks belonging to one of the nominated docs
-    conn = psycopg.connect(**db_config)
-    cur = conn.cursor()
-
-    cur.execute(
-        f"""
-        SELECT embeddings.id
-        FROM langchain_pg_embedding embeddings
-        JOIN langchain_pg_collection collection
-            ON embeddings.collection_id = collection.uuid
-        WHERE collection.name = '{collection_name}'
-        AND embeddings.cmetadata->>'embedding_type' = 'chunk'
-        AND embeddings.cmetadata->>'id' = ANY(ARRAY{[[doc.id for doc in docs]]});
-        """
-    )
-    chunk_ids_to_delete = list(cur.fetchall())
-
-    vector_db.delete(
-        ids=[chunk_id[0] for chunk_id in chunk_ids_to_delete],
+) -> UpdatePlan:
+    """Work out how to bring the stored rows of updated pages in line with their new docs and chunks.
+
+    Rows whose content hash matches a new doc/chunk of the same page keep their
+    embedding and only get fresh metadata; rows with no match (including any
+    duplicate document rows) are deleted by replace_pages, and only genuinely
+    new text is embedded. Rows stored before content hashes
+    existed are hashed from their text.
+    """
+    existing_rows = db.fetchall(
+        ROWS_FOR_PAGES_QUERY,
+        {"collection_name": collection_name, "page_ids": [doc.id for doc in docs]},
     )
 
-    cur.close()
-    conn.close()
\ No newline at end of file
+    reusable_ids = defaultdict(list)
+    for row in existing_rows:
+        row_hash = row.content_hash or content_hash(row.document)
+        reusable_ids[(row.page_id, row.embedding_type, row_hash)].append(row.id)
+
+    kept = []
+    to_embed = []
+    for doc in chunked_docs + docs:
+        key = (doc.metadata["id"], doc.metadata["embedding_type"], doc.metadata["content_hash"])
+        if reusable_ids[key]:
+            kept.append((reusable_ids[key].pop(), doc))
+        else:
+            to_embed.append(doc)
+
+    print(f"Updating {len(docs)} docs: keeping {len(kept)} embeddings, embedding {len(to_embed)}")
+    return UpdatePlan(kept=kept, to_embed=to_embed)
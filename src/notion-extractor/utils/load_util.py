@@ -2,20 +2,29 @@
 Sourced from https://github.com/johntday/notion-load/blob/main/notion_load/load_util.py
 """
 
-from typing import List
+import hashlib
+from itertools import islice
+from typing import Iterable, Iterator, List
 
 from langchain.docstore.document import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 import os
+import tiktoken
+
+from .block_chunker import chunk_blocks
+
+# The bot answers with gpt-4o, so count tokens with its encoding
+TOKEN_COUNT_ENCODING = "o200k_base"
 
 
 def split_documents(documents, verbose=False) -> List[Document]:
-    clean_documents = [replace_non_ascii(doc) for doc in documents]
+    chunk_size = int(os.getenv("CHUNK_SIZE"))
+    chunk_overlap = int(os.getenv("CHUNK_OVERLAP"))
 
     # The default list of separators is ["\n\n", "\n", " ", ""]
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=int(os.getenv("CHUNK_SIZE")),
-        chunk_overlap=int(os.getenv("CHUNK_OVERLAP")),
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
         length_function=len,
         separators=[
             "---",
@@ -34,7 +43,19 @@ def split_documents(documents, verbose=False) -> List[Document]:
         ],
     )
 
-    document_chunks = text_splitter.split_documents(clean_documents)
+    # Notion pages carry their top-level blocks in metadata["blocks"] and are
+    # chunked along them; anything else goes through the text splitter
+    document_chunks: List[Document] = []
+    for doc in documents:
+        blocks = doc.metadata.pop("blocks", None)
+        if blocks is None:
+            document_chunks.extend(text_splitter.split_documents([replace_non_ascii(doc)]))
+            continue
+        clean_blocks = [
+            {**block, "text": clean_text(block["text"]) if block["text"] is not None else None}
+            for block in blocks
+        ]
+        document_chunks.extend(chunk_blocks(clean_blocks, doc.metadata, chunk_size, chunk_overlap))
 
     # Add metadata field to identify this as a chunk (rather than a full document)
     for doc in document_chunks:
@@ -48,15 +69,52 @@ def split_documents(documents, verbose=False) -> List[Document]:
     return document_chunks
 
 
+def batched(items: Iterable, batch_size: int) -> Iterator[List]:
+    """
+    Groups items into lists of up to batch_size, pulling from the iterable lazily
+    """
+    iterator = iter(items)
+    while batch := list(islice(iterator, batch_size)):
+        yield batch
+
+
+def add_token_counts(documents: List[Document]) -> List[Document]:
+    """
+    Stores each document's prompt token count in metadata["token_count"], so the
+    bot can pack retrieved context into its token budget without re-tokenizing
+    """
+    encoding = tiktoken.get_encoding(TOKEN_COUNT_ENCODING)
+    for doc in documents:
+        doc.metadata["token_count"] = len(encoding.encode(doc.page_content, disallowed_special=()))
+    return documents
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def add_content_hashes(documents: List[Document]) -> List[Document]:
+    """
+    Stores a hash of each document's text in metadata["content_hash"], so an
+    updated page only re-embeds the chunks whose text actually changed
+    """
+    for doc in documents:
+        doc.metadata["content_hash"] = content_hash(doc.page_content)
+    return documents
+
+
 def replace_non_ascii(doc: Document) -> Document:
     """
     Replaces non-ascii characters with ascii characters
     """
-    page_content = (
-        doc.page_content.replace("\ue05c", "fi")
+    return Document(page_content=clean_text(doc.page_content), metadata=doc.metadata)
+
+
+def clean_text(text: str) -> str:
+    text = (
+        text.replace("\ue05c", "fi")
         .replace("\ufb01", "fi")
         .replace("\x00", " ")
         .replace("\u0000", " ")
     )
-    page_content_ascii = page_content.encode("ascii", "ignore").decode()
-    return Document(page_content=page_content_ascii, metadata=doc.metadata)
+    return text.encode("ascii", "ignore").decode()
@@ -0,0 +1,149 @@
+"""
+Rate limited, pooled HTTP client for the Notion API
+"""
+
+import random
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRYABLE_STATUS_CODES = [429, 500, 502, 503, 504]
+
+
+class TokenBucket:
+    """Thread-safe token bucket shared by every request the loader makes.
+    Args:
+        rate (float): Tokens added per second (Notion allows ~3 requests/s on average).
+        capacity (int): Maximum burst size.
+    """
+
+    def __init__(self, rate: float, capacity: int = 3) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Block until a token is available and take it. Returns the time spent waiting."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if now >= self.paused_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for `seconds`, e.g. when Notion answers 429 with Retry-After."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+
+
+class NotionClient:
+    """Pooled requests session for the Notion API with a shared rate limit.
+
+    Every attempt takes a token from the bucket first, so concurrent workers
+    stay under Notion's limit together. A 429 pauses the whole bucket for the
+    Retry-After the API sends back; other failures back off exponentially with
+    full jitter. Successful requests never sleep beyond the rate limit.
+    Args:
+        headers (dict): Headers sent with every request (auth, Notion-Version).
+        requests_per_second (float): Shared request rate.
+        timeout (int): Timeout for requests to Notion API.
+        retry_count (int): Number of attempts per request.
+        wait (float): Base backoff in seconds after a failed attempt.
+        max_wait (float): Cap on a single backoff.
+        pool_size (int): Number of pooled HTTP connections.
+    """
+
+    def __init__(self,
+                 headers: Dict[str, str],
+                 requests_per_second: float = 3.0,
+                 timeout: int = 10000,
+                 retry_count: int = 5,
+                 wait: float = 1.0,
+                 max_wait: float = 30.0,
+                 pool_size: int = 8,
+                 ) -> None:
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.bucket = TokenBucket(requests_per_second, capacity=max(1, int(requests_per_second)))
+        self.timeout = timeout
+        self.retry_count = retry_count
+        self.wait = wait
+        self.max_wait = max_wait
+        self.stats_lock = threading.Lock()
+        self.request_stats = {"requests": 0, "retries": 0, "throttled": 0, "rate_limit_wait_s": 0.0}
+
+    def close(self) -> None:
+        self.session.close()
+
+    def request(self,
+                url: str,
+                method: str = "GET",
+                query_dict: Optional[Dict[str, Any]] = None,
+                params: Optional[Dict[str, Any]] = None,
+                ) -> Any:
+        """Make a request to the Notion API and return the decoded JSON body."""
+        for attempt in range(self.retry_count):
+            waited = self.bucket.acquire()
+            self._record(requests=1, rate_limit_wait_s=waited, retries=1 if attempt else 0)
+
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    json=query_dict if method != "GET" else None,
+                    params=params,
+                    timeout=self.timeout,
+                )
+            except requests.exceptions.RequestException as e:
+                print(f"Request to Notion API failed ({e}). Retrying...")
+                self._backoff(attempt)
+                continue
+
+            if response.status_code == 429:
+                retry_after = self._retry_after(response, attempt)
+                print(f"Got 429 from Notion API. Retrying after {retry_after:.1f}s...")
+                self._record(throttled=1)
+                self.bucket.pause(retry_after)
+                continue
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                print(f"Got {response.status_code} from Notion API. Retrying...")
+                self._backoff(attempt)
+                continue
+            return response.json()
+
+        raise ValueError(f"Failed to get response from Notion API after {self.retry_count} retries")
+
+    def stats(self) -> Dict[str, Any]:
+        with self.stats_lock:
+            return dict(self.request_stats)
+
+    def _backoff(self, attempt: int) -> None:
+        time.sleep(random.uniform(0, min(self.max_wait, self.wait * 2 ** attempt)))
+
+    def _retry_after(self, response: requests.Response, attempt: int) -> float:
+        try:
+            return float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return random.uniform(0, min(self.max_wait, self.wait * 2 ** attempt))
+
+    def _record(self, **counts) -> None:
+        with self.stats_lock:
+            for key, value in counts.items():
+                self.request_stats[key] += value
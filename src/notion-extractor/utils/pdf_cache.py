@@ -0,0 +1,79 @@
+"""
+On-disk cache of extracted PDF text, keyed by download ETag or content hash
+"""
+
+import json
+import time
+from typing import List, Optional
+
+from .sqlite_cache import SqliteLruCache, purge_cache_file
+
+PDF_CACHE_DDL = """
+    CREATE TABLE IF NOT EXISTS pdf_pages (
+        key TEXT PRIMARY KEY,
+        pages TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        accessed_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS ix_pdf_pages_accessed_at ON pdf_pages (accessed_at);
+"""
+
+
+def purge_pdf_cache(path: str):
+    """Delete the cache file (and SQLite's WAL/shared-memory side files)."""
+    purge_cache_file(path, "PDF text cache")
+
+
+def etag_key(etag: str) -> str:
+    return f"etag:{etag}"
+
+
+def content_hash_key(sha256: str) -> str:
+    return f"sha256:{sha256}"
+
+
+class PdfTextCache(SqliteLruCache):
+    """SQLite-backed cache of the page texts of parsed PDFs.
+
+    Notion serves files from signed URLs that change on every request, so
+    entries are keyed by the storage ETag (checked before the body is
+    downloaded) or the sha256 of the file (checked before parsing). The least
+    recently used entries are evicted once the cache grows past max_bytes.
+    Args:
+        path (str): Path of the SQLite file.
+        max_bytes (int): Size bound on the cached page text.
+    """
+
+    TABLE = "pdf_pages"
+    DDL = PDF_CACHE_DDL
+
+    def __init__(self,
+                 path: str,
+                 max_bytes: int = 256 * 1024 * 1024,
+                 ) -> None:
+        super().__init__(path, max_bytes)
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self.lock:
+            row = self.conn.execute("SELECT pages FROM pdf_pages WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.cache_stats["misses"] += 1
+                return None
+            self.conn.execute("UPDATE pdf_pages SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.cache_stats["hits"] += 1
+            return json.loads(row[0])
+
+    def put(self, keys: List[str], pages: List[str]):
+        """Store the page texts under every key the file is known by."""
+        payload = json.dumps(pages)
+        with self.lock:
+            added_bytes = 0
+            for key in keys:
+                previous = self.conn.execute("SELECT size FROM pdf_pages WHERE key = ?", (key,)).fetchone()
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO pdf_pages VALUES (?, ?, ?, ?)",
+                    (key, payload, len(payload), time.time()),
+                )
+                added_bytes += len(payload) - (previous[0] if previous else 0)
+            self._record_writes(len(keys), added_bytes)
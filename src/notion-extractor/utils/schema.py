@@ -0,0 +1,317 @@
+"""
+Tables the loader maintains alongside the langchain_postgres schema
+"""
+
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from psycopg import Connection
+
+from .db import Database
+
+COLLECTION_VERSION_DDL = """
+    CREATE TABLE IF NOT EXISTS loremaster_collection_version (
+        collection_name TEXT PRIMARY KEY,
+        version BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+SESSION_NARRATIVE_DDL = """
+    CREATE TABLE IF NOT EXISTS loremaster_session_narrative (
+        collection_name TEXT PRIMARY KEY,
+        narrative TEXT,
+        generated_at TIMESTAMPTZ,
+        invalidated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+# One row per Session Notes page, so the latest / previous N sessions are an
+# index range read instead of a JSONB scan and sort over every document.
+# document_id points at the page's embedding_type=document row.
+SESSION_TIMELINE_DDL = """
+    CREATE TABLE IF NOT EXISTS loremaster_session_timeline (
+        collection_name TEXT NOT NULL,
+        page_id TEXT NOT NULL,
+        session_number INT NOT NULL,
+        created_time TIMESTAMPTZ,
+        document_id TEXT NOT NULL,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (collection_name, page_id)
+    );
+    CREATE INDEX IF NOT EXISTS ix_loremaster_session_timeline_latest
+        ON loremaster_session_timeline (collection_name, session_number DESC, created_time DESC);
+"""
+
+# COLLECTION_NAME is an alias for the collection the bot reads from. Full loads
+# build a shadow collection and swap the alias to it in one transaction. With
+# no alias row, the alias name is itself the live (pre-alias) collection.
+COLLECTION_ALIAS_DDL = """
+    CREATE TABLE IF NOT EXISTS loremaster_collection_alias (
+        alias TEXT PRIMARY KEY,
+        collection_name TEXT NOT NULL,
+        swapped_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+# Collections the alias pointed at before a swap replaced them. Only these are
+# ever garbage collected, so a shadow another loader run is still building is
+# left alone.
+RETIRED_COLLECTION_DDL = """
+    CREATE TABLE IF NOT EXISTS loremaster_retired_collection (
+        collection_name TEXT PRIMARY KEY,
+        alias TEXT NOT NULL,
+        retired_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+COLLECTION_ALIAS_QUERY = """
+    SELECT collection_name,
+        swapped_at > now() - make_interval(secs => %(grace_seconds)s) AS recently_swapped
+    FROM loremaster_collection_alias
+    WHERE alias = %(alias)s;
+"""
+
+SWAP_# Collections the alias pointed at before a swap replaced them. Only these are
+# ever garbage collected, so a shadow another loader run is still building is
+# left alone.
+RETIRED_COLLECTION_DDL = """
+    CREATE TABLE IF NOT EXISTS loremaster_retired_collection (
+        collection_name TEXT PRIMARY KEY,
+        alias TEXT NOT NULL,
+        retired_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+"""
+
+COLLECTION_ALIAS_QUERY = """
+    INSERT INTO loremaster_collection_alias (alias, collection_name)
+    VALUES (%(alias)s, %(collection_name)s)
+    ON CONFLICT (alias) DO UPDATE
+        SET collection_name = EXCLUDED.collection_name,
+            swapped_at = now();
+"""
+
+# Runs before the swap in the same transaction: the alias's current target (the
+# alias itself before the first swap) is retired by it. The row lock keeps two
+# concurrent swaps from both missing the target in between.
+RETIRE_ALIAS_TARGET_QUERY = """
+    INSERT INTO loremaster_retired_collection (collection_name, alias)
+    SELECT COALESCE(
+            (SELECT collection_name FROM loremaster_collection_alias WHERE alias = %(alias)s FOR UPDATE),
+            %(alias)s),
+        %(alias)s
+    ON CONFLICT (collection_name) DO NOTHING;
+"""
+
+RETIRED_COLLECTIONS_QUERY = """
+    SELECT collection_name AS name
+    FROM loremaster_retired_collection
+    WHERE alias = %(alias)s
+    AND collection_name <> %(live_collection)s;
+"""
+
+# Shadows that were never live: abandoned by a failed rebuild, or still being
+# built by another loader run. Reported, never dropped automatically.
+UNTRACKED_SHADOWS_QUERY = """
+    SELECT collection.name
+    FROM langchain_pg_collection collection
+    WHERE left(collection.name, length(%(alias)s) + 2) = %(alias)s || '__'
+    AND collection.name <> %(live_collection)s
+    AND NOT EXISTS (
+        SELECT 1 FROM loremaster_retired_collection retired
+        WHERE retired.collection_name = collection.name
+    );
+"""
+
+FORGET_RETIRED_COLLECTION_QUERY = """
+    DELETE FROM loremaster_retired_collection
+    WHERE collection_name = %(collection_name)s;
+"""
+
+# Embeddings go with the collection (ON DELETE CASCADE)
+DELETE_COLLECTION_QUERY = """
+    DELETE FROM langchain_pg_collection
+    WHERE name = %(collection_name)s;
+"""
+
+DELETE_COLLECTION_TIMELINE_QUERY = """
+    DELETE FROM loremaster_session_timeline
+    WHERE collection_name = %(collection_name)s;
+"""
+
+BUMP_COLLECTION_VERSION_QUERY = """
+    INSERT INTO loremaster_collection_version (collection_name, version)
+    VALUES (%(collection_name)s, 1)
+    ON CONFLICT (collection_name) DO UPDATE
+        SET version = loremaster_collection_version.version + 1,
+            updated_at = now()
+    RETURNING version;
+"""
+
+INVALIDATE_SESSION_NARRATIVE_QUERY = """
+    INSERT INTO loremaster_session_narrative (collection_name)
+    VALUES (%(collection_name)s)
+    ON CONFLICT (collection_name) DO UPDATE
+        SET invalidated_at = now();
+"""
+
+SESSION_TIMELINE_UPSERT_QUERY = """
+    INSERT INTO loremaster_session_timeline (collection_name, page_id, session_number, created_time, document_id)
+    SELECT DISTINCT ON (embeddings.cmetadata->>'id')
+        collection.name,
+        embeddings.cmetadata->>'id',
+        (embeddings.cmetadata->>'session_number')::INT,
+        (embeddings.cmetadata->>'created time')::TIMESTAMPTZ,
+        embeddings.id
+    FROM langchain_pg_embedding embeddings
+    JOIN langchain_pg_collection collection
+        ON embeddings.collection_id = collection.uuid
+    WHERE collection.name = %(collection_name)s
+    AND embeddings.cmetadata->>'embedding_type' = 'document'
+    AND embeddings.cmetadata ? 'session_number'
+    ORDER BY embeddings.cmetadata->>'id', embeddings.cmetadata->>'last modified' DESC
+    ON CONFLICT (collection_name, page_id) DO UPDATE
+        SET session_number = EXCLUDED.session_number,
+            created_time = EXCLUDED.created_time,
+            document_id = EXCLUDED.document_id,
+            updated_at = now()
+        WHERE (loremaster_session_timeline.session_number, loremaster_session_timeline.created_time, loremaster_session_timeline.document_id)
+            IS DISTINCT FROM (EXCLUDED.session_number, EXCLUDED.created_time, EXCLUDED.document_id);
+"""
+
+SESSION_TIMELINE_DELETE_STALE_QUERY = """
+    DELETE FROM loremaster_session_timeline timeline
+    WHERE timeline.collection_name = %(collection_name)s
+    AND NOT EXISTS (
+        SELECT 1
+        FROM langchain_pg_embedding embeddings
+        WHERE embeddings.id = timeline.document_id
+        AND embeddings.cmetadata ? 'session_number'
+    );
+"""
+
+
+def ensure_schema(db: Database):
+    """Create the loader-managed tables if they don't exist yet."""
+    with db.transaction() as conn:
+        conn.execute(COLLECTION_VERSION_DDL)
+        conn.execute(SESSION_NARRATIVE_DDL)
+        conn.execute(SESSION_TIMELINE_DDL)
+        conn.execute(COLLECTION_ALIAS_DDL)
+        conn.execute(RETIRED_COLLECTION_DDL)
+
+
+def bump_collection_version(
+    db: Database,
+    collection_name: str,
+    conn: Optional[Connection] = None,
+) -> int:
+    """Increment the collection's version so consumers (e.g. the bot's answer cache) drop stale state."""
+    row = db.fetchone(BUMP_COLLECTION_VERSION_QUERY, {"collection_name": collection_name}, conn=conn)
+    print(f"Collection '{collection_name}' is now at version {row.version}")
+    return row.version
+
+
+def invalidate_session_narrative(
+    db: Database,
+    collection_name: str,
+    conn: Optional[Connection] = None,
+):
+    """Mark the stored /last-session narrative stale so the bot regenerates it in the background."""
+    db.execute(INVALIDATE_SESSION_NARRATIVE_QUERY, {"collection_name": collection_name}, conn=conn)
+    print(f"Invalidated stored last session narrative for collection '{collection_name}'")
+
+
+def sync_session_timeline(
+    db: Database,
+    collection_name: str,
+    conn: Optional[Connection] = None,
+):
+    """Bring the session timeline in line with the session notes documents in the collection.
+
+    Runs as one set-based transaction, so readers see either the old or the new
+    timeline, and covers every session document rather than just the current batch.
+    Pass conn to commit it together with the writes it reflects.
+    """
+    with db.transaction(conn) as conn:
+        upserted = db.execute(SESSION_TIMELINE_UPSERT_QUERY, {"collection_name": collection_name}, conn=conn)
+        deleted = db.execute(SESSION_TIMELINE_DELETE_STALE_QUERY, {"collection_name": collection_name}, conn=conn)
+    print(f"Session timeline synced: {upserted} upserted, {deleted} removed")
+
+
+def resolve_collection(
+    db: Database,
+    alias: str,
+) -> str:
+    """The collection the alias currently points at (the alias itself before the first swap)."""
+    row = db.fetchone(COLLECTION_ALIAS_QUERY, {"alias": alias, "grace_seconds": 0})
+    return row.collection_name if row else alias
+
+
+def shadow_collection_name(alias: str) -> str:
+    return f"{alias}__{datetime.now(timezone.utc):%Y%m%d%H%M%S}"
+
+
+def swap_collection_alias(
+    db: Database,
+    alias: str,
+    collection_name: str,
+):
+    """Point the alias at a freshly built collection.
+
+    The previous target is recorded as retired, and the swap, the version bump
+    (which makes the bot drop cached answers and re-resolve the alias) and the
+    narrative invalidation commit together.
+    """
+    with db.transaction() as conn:
+        db.execute(RETIRE_ALIAS_TARGET_QUERY, {"alias": alias}, conn=conn)
+        db.execute(SWAP_COLLECTION_ALIAS_QUERY, {"alias": alias, "collection_name": collection_name}, conn=conn)
+        bump_collection_version(db, alias, conn=conn)
+        invalidate_session_narrative(db, alias, conn=conn)
+    print(f"Collection alias '{alias}' now points at '{collection_name}'")
+
+
+def garbage_collect_collections(
+    db: Database,
+    alias: str,
+    grace_seconds: float,
+) -> List[str]:
+    """Drop the collections a swap has retired from the alias.
+
+    Shadows that were never live are only reported: another loader run may
+    still be building one, and dropping it would cascade into its writes.
+    Skipped while the last swap is younger than grace_seconds, so bots still
+    holding the old alias in their cache can finish reading from it.
+    """
+    row = db.fetchone(COLLECTION_ALIAS_QUERY, {"alias": alias, "grace_seconds": grace_seconds})
+    if row and row.recently_swapped:
+        print(f"Alias '{alias}' was swapped less than {grace_seconds}s ago, not collecting old collections yet")
+        return []
+
+    live_collection = row.collection_name if row else alias
+    params = {"alias": alias, "live_collection": live_collection}
+    retired = [r.name for r in db.fetchall(RETIRED_COLLECTIONS_QUERY, params)]
+    for collection_name in retired:
+        with db.transaction() as conn:
+            db.execute(DELETE_COLLECTION_TIMELINE_QUERY, {"collection_name": collection_name}, conn=conn)
+            db.execute(DELETE_COLLECTION_QUERY, {"collection_name": collection_name}, conn=conn)
+            db.execute(FORGET_RETIRED_COLLECTION_QUERY, {"collection_name": collection_name}, conn=conn)
+        print(f"Dropped retired collection '{collection_name}'")
+    for row in db.fetchall(UNTRACKED_SHADOWS_QUERY, params):
+        print(f"Leaving shadow collection '{row.name}' alone: it was never live and may still be building")
+    return retired
+
+
+def swap_and_collect(
+    db: Database,
+    alias: str,
+    collection_name: str,
+    grace_seconds: float,
+):
+    """Swap the alias to a new collection, wait out the grace period, then drop the old ones."""
+    swap_collection_alias(db, alias, collection_name)
+    if grace_seconds > 0:
+        print(f"Waiting {grace_seconds}s for readers of the old collection before dropping it")
+        time.sleep(grace_seconds)
+    garbage_collect_collections(db, alias, grace_seconds=0)
@@ -0,0 +1,89 @@
+"""
+Size-bounded SQLite store shared by the on-disk caches
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Any, Dict
+
+
+def purge_cache_file(path: str, description: str):
+    """Delete a cache file (and SQLite's WAL/shared-memory side files)."""
+    for suffix in ["", "-wal", "-shm"]:
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    print(f"Purged {description} at {path}")
+
+
+class SqliteLruCache:
+    """Base of the SQLite-backed caches: one table of entries, each with its
+    size in bytes and last access time, evicted least recently used first
+    once the total grows past max_bytes.
+
+    Subclasses set TABLE and DDL (the table needs `size` and `accessed_at`
+    columns, keyed by KEY_COLUMN) and implement their own reads and writes
+    under self.lock, calling _record_writes after each write. Safe to share
+    between threads, and between processes (WAL mode).
+    Args:
+        path (str): Path of the SQLite file.
+        max_bytes (int): Size bound on the cached entries.
+    """
+
+    TABLE: str
+    DDL: str
+    KEY_COLUMN = "key"
+
+    def __init__(self,
+                 path: str,
+                 max_bytes: int,
+                 ) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(self.DDL)
+        self.total_bytes = self._stored_bytes()
+        self.cache_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.cache_stats["hits"] + self.cache_stats["misses"]
+        return {
+            **self.cache_stats,
+            "hit_rate": self.cache_stats["hits"] / lookups if lookups else 0.0,
+            "bytes": self.total_bytes,
+        }
+
+    def _record_writes(self, writes: int, added_bytes: int):
+        """Account for entries just written, evict if over the limit and commit. Call under self.lock."""
+        self.total_bytes += added_bytes
+        self.cache_stats["writes"] += writes
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+        self.conn.commit()
+
+    def _stored_bytes(self) -> int:
+        return self.conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.TABLE}").fetchone()[0]
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under 90% of max_bytes.
+        Re-reads the stored size first, since another process may share the file."""
+        self.total_bytes = self._stored_bytes()
+        target = int(self.max_bytes * 0.9)
+        rows = self.conn.execute(f"SELECT {self.KEY_COLUMN}, size FROM {self.TABLE} ORDER BY accessed_at").fetchall()
+        evicted = []
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            evicted.append((key,))
+            self.total_bytes -= size
+        self.conn.executemany(f"DELETE FROM {self.TABLE} WHERE {self.KEY_COLUMN} = ?", evicted)
+        self.cache_stats["evictions"] += len(evicted)
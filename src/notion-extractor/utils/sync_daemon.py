@@ -0,0 +1,117 @@
+"""
+Daemon loop that polls Notion for edits and runs incremental syncs
+"""
+
+import signal
+import threading
+import time
+import traceback
+from datetime import timedelta
+from typing import Callable, Optional
+
+from .MyNotionDBLoader import EDIT_SETTLE_TIME, is_settled
+
+
+class AdaptivePoller:
+    """Poll interval that snaps back to min_interval when a change is seen
+    and grows by `backoff` after every idle poll, up to max_interval.
+    Args:
+        min_interval (float): Seconds between polls right after an edit.
+        max_interval (float): Upper bound on the seconds between polls while idle.
+        backoff (float): Factor the interval grows by per idle poll.
+    """
+
+    def __init__(self,
+                 min_interval: float = 15.0,
+                 max_interval: float = 600.0,
+                 backoff: float = 2.0,
+                 ) -> None:
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("need 0 < min_interval <= max_interval")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+
+    def observe(self, changed: bool) -> float:
+        """Record the outcome of a poll and return how long to wait before the next one."""
+        if changed:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+        return self.interval
+
+
+def stop_on_signals() -> threading.Event:
+    """Event that is set on SIGINT/SIGTERM, so the daemon finishes its current
+    sync and shuts down cleanly instead of dying mid-transaction."""
+    stop = threading.Event()
+
+    def handle(signum, frame):
+        print(f"Received signal {signum}, stopping after the current cycle")
+        stop.set()
+
+    signal.signal(signal.SIGINT, handle)
+    signal.signal(signal.SIGTERM, handle)
+    return stop
+
+
+def run_daemon(
+    latest_edit: Callable[[], Optional[str]],
+    sync: Callable[[], None],
+    poller: AdaptivePoller,
+    resync_interval: float,
+    stop: threading.Event,
+    watermark: Optional[str] = None,
+    settle_time: timedelta = EDIT_SETTLE_TIME,
+):
+    """Poll `latest_edit` (the newest last_edited_time in the Notion database)
+    and call `sync` whenever it moves past the watermark.
+
+    Deleting a page doesn't touch any other page's last_edited_time, so a sync
+    also runs at least every resync_interval seconds to sweep deleted pages.
+    The watermark is read before syncing, so edits made during a sync trigger
+    another one. Errors are logged and retried on the next poll rather than
+    ending the daemon.
+
+    Notion rounds last_edited_time down to the minute, so a later edit in the
+    watermark's minute doesn't move it. If the last sync ran before that
+    minute settled, one more sync runs once it has.
+
+    Args:
+        latest_edit (Callable): Cheap probe returning the newest last_edited_time.
+        sync (Callable): Runs one incremental sync.
+        poller (AdaptivePoller): Decides the wait between polls.
+        resync_interval (float): Longest time between syncs, edits or not.
+        stop (threading.Event): Set to end the loop.
+        watermark (str): last_edited_time the collection is already in sync with.
+        settle_time (timedelta): How long after its minute a last_edited_time is final.
+    """
+    last_sync = time.monotonic()
+    # Whether the watermark's minute had settled when it was synced; unknown for
+    # the caller's watermark, so that gets one settling sync to be safe
+    synced_settled = False
+    while not stop.is_set():
+        changed = False
+        unsettled = False
+        try:
+            latest = latest_edit()
+            changed = latest is not None and (watermark is None or latest > watermark)
+            unsettled = latest is not None and latest == watermark and not synced_settled
+            settling = unsettled and is_settled(latest, settle_time)
+            if changed or settling or time.monotonic() - last_sync >= resync_interval:
+                reason = f"edit at {latest}" if changed else "edits settled" if settling else "periodic resync"
+                print(f"\nSyncing ({reason})")
+                start = time.perf_counter()
+                latest_settled = latest is None or is_settled(latest, settle_time)
+                sync()
+                watermark, synced_settled = latest, latest_settled
+                last_sync = time.monotonic()
+                print(f"Sync finished in {time.perf_counter() - start:.1f}s")
+        except Exception:
+            print("SYNC FAILED, retrying on the next poll")
+            traceback.print_exc()
+        # Keep polling quickly until the settling sync has run
+        wait = poller.observe(changed or unsettled)
+        print(f"Next poll in {wait:.0f}s")
+        stop.wait(wait)